@@ -7,13 +7,30 @@ Demonstrates OOP principles, OpenCV image processing, and GUI development
 import tkinter as tk
 from tkinter import filedialog, messagebox, ttk
 import os
-import cv2
-import numpy as np
+from concurrent.futures import CancelledError
+from display_cache import DisplayCache, crop_view, fit_scale
+from encoder import DEFAULT_PRESET, PRESETS
 from history_manager import HistoryManager
 from image_processor import ImageProcessor
+from operations import DEFAULT_RESIZE_QUALITY, GEOMETRY_OPS, REGION_OPS, RESIZE_QUALITIES, region_rect
+from preview_worker import PreviewWorker
+from process_backend import ProcessBackend
+from save_worker import SaveWorker
+from tracing import TRACER
 from PIL import Image, ImageTk
 
 
+# Wait this long after the last slider movement before starting a preview
+PREVIEW_DEBOUNCE_MS = 40
+
+# How often to check whether a background full-resolution decode finished
+DECODE_POLL_MS = 100
+
+# Full-resolution renders of images above this size run in a worker process
+BACKGROUND_RENDER_PIXELS = 4_000_000
+RENDER_POLL_MS = 50
+
+
 class ImageEditorApp:
     """
     Main application class for the Image Editor.
@@ -40,14 +57,40 @@ class ImageEditorApp:
         
         # Initialize image processor and history manager (Class Interaction)
         self.processor = ImageProcessor()
-        self.history = HistoryManager()
+        self.processor.enable_tiling()  # only kicks in for very large images
+        # Replays go through the processor's result cache: an undo that
+        # rebuilds a state gets back the states computed before
+        self.history = HistoryManager(replay=self.processor.replay)
+        self.display = DisplayCache(self.processor, 900, 650)
         
         # Current state variables (Encapsulation)
         self.current_path = None
         self.tk_img = None
         self.original_image = None
-        self.zoom_factor = 1.0
-
+        self.zoom_factor = 1.0   # relative to "fit in window"
+        self.view_center = None  # image point in the middle of the view (None = centre)
+        self._pan_start = None
+        self._redraw_pending = False
+        # Selected rectangle (x, y, w, h) in image pixels: filters then
+        # change only this part (None = whole image)
+        self.region = None
+        self._region_start = None
+
+        # Live slider previews run on a background thread (never blocks Tk)
+        self.preview_worker = PreviewWorker(
+            self.root, on_error=lambda e: self._set_status(f"Preview failed: {e}"))
+        self._preview_after_id = None
+
+        # Saves render + encode on a background thread (editing continues)
+        self.save_worker = SaveWorker(self.root, self._save_progress, self._save_done)
+        self.save_preset = tk.StringVar(value=DEFAULT_PRESET)
+        self._save_as = {}  # path -> image it was "saved as" for, until the save is done
+
+        # Full-resolution renders of big images run in worker processes
+        # (pixels shared, not copied); a coarser level is shown meanwhile
+        self.backend = ProcessBackend()
+        self._render_job = None      # (snapshot, future) being rendered
+        self._render_skipped = None  # version whose render the user cancelled
         
         # Build GUI components
         self._build_menu()
@@ -59,6 +102,7 @@ class ImageEditorApp:
         self.root.bind("<Control-Shift-S>", lambda e: self.save_as_image())
         self.root.bind("<Control-z>", lambda e: self.undo())
         self.root.bind("<Control-y>", lambda e: self.redo())
+        self.root.bind("<Escape>", lambda e: self.cancel_render())
 
     
     def _build_menu(self):
@@ -70,6 +114,12 @@ class ImageEditorApp:
         file_menu.add_command(label="Open", command=self.open_image, accelerator="Ctrl+O")
         file_menu.add_command(label="Save", command=self.save_image, accelerator="Ctrl+S")
         file_menu.add_command(label="Save As", command=self.save_as_image, accelerator="Ctrl+Shift+S")
+
+        # Encoder presets: encode time vs file size
+        preset_menu = tk.Menu(file_menu, tearoff=0)
+        for key, preset in PRESETS.items():
+            preset_menu.add_radiobutton(label=preset.label, value=key, variable=self.save_preset)
+        file_menu.add_cascade(label="Save Options", menu=preset_menu)
         file_menu.add_separator()
         file_menu.add_command(label="Exit", command=self._exit_application)
         
@@ -80,8 +130,20 @@ class ImageEditorApp:
         edit_menu.add_separator()
         edit_menu.add_command(label="Reset to Original", command=self.reset_to_original)
         
+        # Performance Menu (tracing)
+        self.tracing_enabled = tk.BooleanVar(value=False)
+        perf_menu = tk.Menu(menubar, tearoff=0)
+        perf_menu.add_checkbutton(label="Show Timings", variable=self.tracing_enabled,
+                                  command=self._toggle_tracing)
+        perf_menu.add_command(label="Export Trace...", command=self.export_trace)
+        perf_menu.add_command(label="Result Cache Stats", command=self.show_cache_stats)
+        perf_menu.add_separator()
+        perf_menu.add_command(label="Cancel Rendering", command=self.cancel_render,
+                              accelerator="Esc")
+
         menubar.add_cascade(label="File", menu=file_menu)
         menubar.add_cascade(label="Edit", menu=edit_menu)
+        menubar.add_cascade(label="Performance", menu=perf_menu)
         
         self.root.config(menu=menubar)
     
@@ -122,10 +184,18 @@ class ImageEditorApp:
         self.right_panel = tk.Frame(self.root, bg="#2b2b2b")
         self.right_panel.pack(side=tk.RIGHT, fill=tk.BOTH, expand=True, padx=5, pady=5)
         
-        # Image canvas
-        self.canvas = tk.Label(self.right_panel, bg="#2b2b2b", text="No Image Loaded", 
-                            fg="white", font=("Arial", 16))
+        # Image canvas: only the visible part of the image is drawn on it
+        self.canvas = tk.Canvas(self.right_panel, bg="#2b2b2b", highlightthickness=0)
         self.canvas.pack(fill=tk.BOTH, expand=True)
+        self.canvas.create_text(450, 325, text="No Image Loaded", fill="white",
+                                font=("Arial", 16), tags="placeholder")
+        self._canvas_image = self.canvas.create_image(0, 0, anchor="nw")
+
+        # Click-drag panning (or region selection); a resized window needs a new crop
+        self.canvas.bind("<ButtonPress-1>", self._press)
+        self.canvas.bind("<B1-Motion>", self._drag)
+        self.canvas.bind("<ButtonRelease-1>", self._release)
+        self.canvas.bind("<Configure>", lambda e: self._schedule_display())
         
         # Build control sections
         self._build_basic_filters()
@@ -137,6 +207,12 @@ class ImageEditorApp:
         status_bar = tk.Label(self.root, textvariable=self.status, anchor="w", 
                             relief=tk.SUNKEN, bg="#e0e0e0", font=("Arial", 9))
         status_bar.pack(side=tk.BOTTOM, fill=tk.X)
+
+        # Timing breakdown of the last edit / redraw (Performance menu)
+        self.trace_text = tk.StringVar()
+        self._edit_trace = ""
+        tk.Label(status_bar, textvariable=self.trace_text, anchor="e",
+                 bg="#e0e0e0", font=("Arial", 9)).pack(side=tk.RIGHT)
     
     def _build_basic_filters(self):
         """Build basic filter buttons section"""
@@ -154,13 +230,15 @@ class ImageEditorApp:
 
         tk.Label(frame, text="Threshold 1 (0-255):", bg="#f0f0f0").pack(anchor="w")
         self.edge_t1 = tk.Scale(frame, from_=0, to=255, orient=tk.HORIZONTAL,
-                                length=200, bg="#f0f0f0")
+                                length=200, bg="#f0f0f0",
+                                command=lambda v: self._schedule_preview("edges"))
         self.edge_t1.set(50)
         self.edge_t1.pack(fill=tk.X, pady=(0, 5))
 
         tk.Label(frame, text="Threshold 2 (0-255):", bg="#f0f0f0").pack(anchor="w")
         self.edge_t2 = tk.Scale(frame, from_=0, to=255, orient=tk.HORIZONTAL,
-                                length=200, bg="#f0f0f0")
+                                length=200, bg="#f0f0f0",
+                                command=lambda v: self._schedule_preview("edges"))
         self.edge_t2.set(150)
         self.edge_t2.pack(fill=tk.X, pady=(0, 5))
 
@@ -175,9 +253,10 @@ class ImageEditorApp:
         frame.pack(fill=tk.X, padx=10, pady=5)
         
         # Blur slider
-        tk.Label(frame, text="Blur Intensity (1-31):", bg="#f0f0f0").pack(anchor="w", pady=(5,0))
-        self.blur_slider = tk.Scale(frame, from_=1, to=31, orient=tk.HORIZONTAL, 
-                                resolution=2, length=200, bg="#f0f0f0")
+        tk.Label(frame, text="Blur Intensity (1-301):", bg="#f0f0f0").pack(anchor="w", pady=(5,0))
+        self.blur_slider = tk.Scale(frame, from_=1, to=301, orient=tk.HORIZONTAL, 
+                                resolution=2, length=200, bg="#f0f0f0",
+                                command=lambda v: self._schedule_preview("blur"))
         self.blur_slider.set(1)
         self.blur_slider.pack(fill=tk.X, pady=(0,5))
         tk.Button(frame, text="Apply Blur", command=self.apply_blur, 
@@ -186,7 +265,8 @@ class ImageEditorApp:
         # Brightness slider
         tk.Label(frame, text="Brightness (-100 to +100):", bg="#f0f0f0").pack(anchor="w", pady=(10,0))
         self.brightness_slider = tk.Scale(frame, from_=-100, to=100, orient=tk.HORIZONTAL, 
-                                        length=200, bg="#f0f0f0")
+                                        length=200, bg="#f0f0f0",
+                                        command=lambda v: self._schedule_preview("brightness"))
         self.brightness_slider.set(0)
         self.brightness_slider.pack(fill=tk.X, pady=(0,5))
         tk.Button(frame, text="Apply Brightness", command=self.apply_brightness, 
@@ -195,7 +275,8 @@ class ImageEditorApp:
         # Contrast slider
         tk.Label(frame, text="Contrast (0.5 to 3.0):", bg="#f0f0f0").pack(anchor="w", pady=(10,0))
         self.contrast_slider = tk.Scale(frame, from_=0.5, to=3.0, resolution=0.1, 
-                                    orient=tk.HORIZONTAL, length=200, bg="#f0f0f0")
+                                    orient=tk.HORIZONTAL, length=200, bg="#f0f0f0",
+                                    command=lambda v: self._schedule_preview("contrast"))
         self.contrast_slider.set(1.0)
         self.contrast_slider.pack(fill=tk.X, pady=(0,5))
         tk.Button(frame, text="Apply Contrast", command=self.apply_contrast, 
@@ -233,6 +314,13 @@ class ImageEditorApp:
                                     length=200, bg="#f0f0f0")
         self.resize_slider.set(100)
         self.resize_slider.pack(fill=tk.X, pady=(0,5))
+
+        # Resampling quality (repeated resizes still resample only once)
+        quality_frame = tk.Frame(frame, bg="#f0f0f0")
+        quality_frame.pack(fill=tk.X, pady=(0, 3))
+        tk.Label(quality_frame, text="Quality:", bg="#f0f0f0").pack(side=tk.LEFT)
+        self.resize_quality = tk.StringVar(value=DEFAULT_RESIZE_QUALITY)
+        tk.OptionMenu(quality_frame, self.resize_quality, *RESIZE_QUALITIES).pack(side=tk.LEFT, padx=4)
         
         tk.Button(frame, text="Apply Resize", command=self.apply_resize, 
                 width=20, bg="#795548", fg="white").pack(pady=3)
@@ -247,6 +335,18 @@ class ImageEditorApp:
                   width=8, bg="#607D8B", fg="white").pack(side=tk.LEFT, padx=2)
         tk.Button(zoom_frame, text="Reset", command=self.zoom_reset,
                   width=8, bg="#607D8B", fg="white").pack(side=tk.LEFT, padx=2)
+        tk.Button(frame, text="Actual Pixels (1:1)", command=self.zoom_actual,
+                  width=20, bg="#607D8B", fg="white").pack(pady=3)
+        tk.Label(frame, text="Drag the image to pan", bg="#f0f0f0",
+                 font=("Arial", 8)).pack(anchor="w")
+
+        # Region of interest: filters and adjustments change only this part
+        tk.Label(frame, text="Region:", bg="#f0f0f0", font=("Arial", 9, "bold")).pack(anchor="w", pady=(10, 2))
+        self.select_region = tk.BooleanVar(value=False)
+        tk.Checkbutton(frame, text="Select region (drag on the image)", variable=self.select_region,
+                       bg="#f0f0f0").pack(anchor="w")
+        tk.Button(frame, text="Clear Region", command=self.clear_region,
+                  width=20, bg="#9E9E9E", fg="white").pack(pady=3)
 
     
     def _set_status(self, text):
@@ -256,6 +356,13 @@ class ImageEditorApp:
     def _exit_application(self):
         """Handle application exit with confirmation"""
         if messagebox.askokcancel("Exit", "Do you want to exit the application?"):
+            self.preview_worker.close()
+            self.backend.close()
+            if self.save_worker.is_busy():
+                self._set_status("Finishing save before exit...")
+                self.root.update_idletasks()
+                self.save_worker.wait(notify=False)
+            self.save_worker.close()
             self.root.quit()
     
     # ==================== File Operations ====================
@@ -277,34 +384,77 @@ class ImageEditorApp:
         if not path:
             return
         
+        self._cancel_preview()
         try:
-            # Load image using ImageProcessor
-            img = self.processor.load(path)
+            # Load image using ImageProcessor: big JPEGs appear at reduced
+            # resolution first, the full decode finishes in the background
+            loading = self.processor.load_fast(path, *self._viewport())
             self.zoom_factor = 1.0
-            self.original_image = img.copy()
+            self.view_center = None
+            self.clear_region()
+            # A LazyImage never changes: keeping it costs no copy
+            self.original_image = self.processor.snapshot()
             self.current_path = path
             
             # Reset history and add initial image
             self.history.reset()
-            self.history.push(img.copy())
+            self.history.push(self.processor.snapshot())
             
             # Display image
-            self.show_image(img)
+            self._refresh_display()
             
             # Update status bar with image info
-            h, w = img.shape[:2]
-            channels = img.shape[2] if len(img.shape) == 3 else 1
+            shape = self.processor.snapshot().shape
+            h, w = shape[:2]
+            channels = shape[2] if len(shape) == 3 else 1
             self._set_status(
                  f"Loaded: {os.path.basename(path)} | Size: {w}x{h} | Channels: {channels}"
+                 + (" | decoding full resolution..." if loading else "")
                      )
+            if loading:
+                self.root.after(DECODE_POLL_MS, lambda: self._watch_decode(path))
 
             
         except Exception as e:
             messagebox.showerror("Error", f"Failed to load image:\n{str(e)}")
     
+    def _watch_decode(self, path):
+        """Redraw in full resolution once the background decode of `path` is done."""
+        if self.current_path != path:
+            return  # another image was opened meanwhile
+        if self.processor.is_loading():
+            self.root.after(DECODE_POLL_MS, lambda: self._watch_decode(path))
+            return
+        error = self.processor.load_error()
+        if error is not None:
+            # The preview came from a reduced decode; without the full pixels
+            # nothing can be saved or drawn 1:1, so the image is closed
+            self._close_image()
+            messagebox.showerror("Error", f"Failed to load image:\n{error}")
+            return
+        # Same image version, but sharper pixels: rebuild the display pyramid
+        self.display.clear()
+        self._schedule_display()
+        self._set_status(f"Loaded: {os.path.basename(path)} | full resolution ready")
+
+    def _close_image(self):
+        """Back to "No Image Loaded" (e.g. the image turned out to be unreadable)."""
+        self._cancel_preview()
+        self.cancel_render()
+        self.processor.set_image(None)
+        self.original_image = None
+        self.current_path = None
+        self.clear_region()
+        self.history.reset()
+        self.display.clear()
+        self._show_view(None)
+        self.canvas.create_text(450, 325, text="No Image Loaded", fill="white",
+                                font=("Arial", 16), tags="placeholder")
+        self._set_status("No image loaded. Use File > Open to load an image.")
+
     def save_image(self):
         """Save the current image to the current path"""
-        if self.processor.get_image() is None:
+        if not self.processor.has_image():
             messagebox.showwarning("Warning", "No image to save!")
             return
         
@@ -312,21 +462,11 @@ class ImageEditorApp:
             self.save_as_image()
             return
         
-        try:
-            ok = cv2.imwrite(self.current_path, self.processor.get_image())
-            if not ok:
-                 raise Exception("Failed to save image (cv2.imwrite returned False).")
-
-            
-            messagebox.showinfo("Success", f"Image saved to:\n{self.current_path}")
-
-
-        except Exception as e:
-            messagebox.showerror("Error", f"Failed to save image:\n{str(e)}")
+        self._start_save(self.current_path)
     
     def save_as_image(self):
         """Save the current image to a new path"""
-        if self.processor.get_image() is None:
+        if not self.processor.has_image():
             messagebox.showwarning("Warning", "No image to save!")
             return
         
@@ -341,67 +481,387 @@ class ImageEditorApp:
         if not path:
             return
         
-        try:
-            ok = cv2.imwrite(path, self.processor.get_image())
-            if not ok:
-             raise Exception("Failed to save image (cv2.imwrite returned False).")
+        # current_path follows only once the file really exists (_save_done)
+        self._save_as[path] = self.original_image
+        self._start_save(path)
 
-            self.current_path = path
-            messagebox.showinfo("Success", f"Image saved to:\n{path}")
-
-        except Exception as e:
-            messagebox.showerror("Error", f"Failed to save image:\n{str(e)}")
+    def _start_save(self, path):
+        """
+        Save in the background: pending (lazy) edits run at full resolution
+        and the image is encoded on the save thread, then written atomically.
+        The image as it is NOW is saved; editing may continue meanwhile.
+        """
+        job = self.processor.save_job(path, PRESETS[self.save_preset.get()])
+        self.save_worker.submit(path, job)
+        self._set_status(f"Saving {os.path.basename(path)}...")
+
+    def _save_progress(self, path, stage, seconds):
+        self._set_status(f"Saving {os.path.basename(path)}: {stage}... ({seconds:.1f} s)")
+
+    def _save_done(self, path, error, seconds):
+        opened = self._save_as.pop(path, None)
+        if error is not None:
+            self._set_status(f"Save failed: {os.path.basename(path)}")
+            messagebox.showerror("Error", f"Failed to save image:\n{str(error)}")
+            return
+        if opened is not None and opened is self.original_image:
+            self.current_path = path  # Save now writes here (same image still open)
+        self._set_status(f"Saved {os.path.basename(path)} in {seconds:.2f} s")
+        messagebox.showinfo("Success", f"Image saved to:\n{path}")
     
     # ==================== Display Methods ====================
     
+    def _viewport(self):
+        """Size of the image canvas (the default size until Tk has laid it out)."""
+        w, h = self.canvas.winfo_width(), self.canvas.winfo_height()
+        if w <= 1 or h <= 1:
+            return self.display.max_w, self.display.max_h
+        return w, h
+
+    def _view(self):
+        """
+        Current view: (screen pixels per image pixel, centre point, viewport).
+        zoom_factor 1.0 fits the whole image in the window.
+        """
+        w, h = self.processor.get_dimensions()
+        viewport = self._viewport()
+        scale = fit_scale(w, h, *viewport) * self.zoom_factor
+        cx, cy = self.view_center or (w / 2, h / 2)
+        # Keep the centre inside the image (size may have changed by an edit)
+        center = (min(max(cx, 0.0), float(w)), min(max(cy, 0.0), float(h)))
+        return scale, center, viewport
+
     def show_image(self, image_bgr):
         """
-        Display an OpenCV image (BGR format) on the canvas.
-        Converts to RGB and resizes to fit the display area.
+        Display an OpenCV image (BGR or grayscale) of the WHOLE picture
+        (e.g. a preview) on the canvas, with the current zoom and pan.
+        Only the visible part is resampled.
         """
-        if image_bgr is None:
+        if image_bgr is None or not self.processor.has_image():
             return
-        
-        # Convert BGR to RGB for display
-        if len(image_bgr.shape) == 2:  # Grayscale
-            rgb = cv2.cvtColor(image_bgr, cv2.COLOR_GRAY2RGB)
-        else:
-            rgb = cv2.cvtColor(image_bgr, cv2.COLOR_BGR2RGB)
-        
-        # Convert to PIL Image and resize to fit canvas
-        pil_img = Image.fromarray(rgb)
-        pil_img.thumbnail((900, 650), Image.Resampling.LANCZOS)
-        #apply zoom(view-only)
-        w, h = pil_img.size
-        pil_img = pil_img.resize(
-        (int(w * self.zoom_factor), int(h * self.zoom_factor)),
-         Image.Resampling.LANCZOS
-         )
+        with TRACER.span("show_image", "app"):
+            scale, center, viewport = self._view()
+            self._show_view(crop_view(image_bgr, self.processor.get_dimensions(), scale, center, viewport))
+        self._show_trace()
+
+    def _show_view(self, view):
+        """Put (RGB pixels, top-left corner) on the canvas."""
+        self.canvas.delete("placeholder")
+        if view is None:
+            self.tk_img = None
+            self.canvas.itemconfig(self._canvas_image, image="")
+            return
+        rgb, (x, y) = view
+        with TRACER.span("photo_image", "app"):
+            self.tk_img = ImageTk.PhotoImage(Image.fromarray(rgb))
+        self.canvas.itemconfig(self._canvas_image, image=self.tk_img)
+        self.canvas.coords(self._canvas_image, x, y)
+        self._draw_region()
+
+    def _refresh_display(self):
+        """
+        Redraw the current image.
+        The display cache keeps an image pyramid per image version; a redraw
+        crops just the visible region from the right level, so its cost
+        depends on the window size only, whatever the zoom.
+        """
+        self._redraw_pending = False
+        if self.processor.has_image():
+            scale, center, viewport = self._view()
+            min_level = 1 if self._render_in_background(scale) else 0
+            with TRACER.span("redraw", "app"):
+                self._show_view(self.display.view(scale, center, viewport, min_level))
+            self._show_trace(self._edit_trace)
 
+    # ==================== Background Rendering ====================
 
-        
-        # Convert to PhotoImage and display
-        self.tk_img = ImageTk.PhotoImage(pil_img)
-        self.canvas.config(image=self.tk_img, text="")
+    def _render_in_background(self, scale):
+        """
+        True if the full-resolution level is needed but not ready: it is then
+        rendered in a worker process (started here if needed) and the caller
+        draws a coarser level meanwhile.
+        """
+        state = self.processor.snapshot()
+        if self._render_job is not None and self._render_job[0] is not state:
+            self._render_job[1].cancel()  # that image is no longer shown
+            self._render_job = None
+            self._set_busy(False)
+        w, h = self.processor.get_dimensions()
+        if (self.display.level_for(scale) > 0 or w * h < BACKGROUND_RENDER_PIXELS
+                or not state.needs_pixel_work() or state.is_pending()):
+            return False
+        if state.version == self._render_skipped:
+            return True  # cancelled by the user: stay on the coarser level
+        if self._render_job is None:
+            self._render_job = (state, self.backend.submit(*state.pending_work()))
+            self._set_busy(True)
+            self.root.after(RENDER_POLL_MS, self._poll_render)
+        return True
+
+    def _poll_render(self):
+        if self._render_job is None:
+            return
+        state, future = self._render_job
+        if not future.done():
+            self.root.after(RENDER_POLL_MS, self._poll_render)
+            return
+        self._render_job = None
+        self._set_busy(False)
+        try:
+            state.fulfil(future.result())
+        except CancelledError:
+            return
+        except Exception as e:
+            self._render_skipped = state.version  # do not retry the same failure
+            self._set_status(f"Full resolution render failed: {e}")
+            return
+        if state is self.processor.snapshot():
+            self._schedule_display()
+
+    def _set_busy(self, busy):
+        """Busy indicator: watch cursor over the image and a status message."""
+        self.canvas.config(cursor="watch" if busy else "")
+        if busy:
+            self._set_status("Rendering full resolution... (Esc to cancel)")
+
+    def cancel_render(self):
+        """Stop waiting for the full-resolution render (the coarser view stays)."""
+        if self._render_job is None:
+            return
+        state, future = self._render_job
+        future.cancel()
+        self._render_job = None
+        self._render_skipped = state.version
+        self._set_busy(False)
+        self._set_status("Rendering cancelled - zoom in again to retry")
+
+    # ==================== Tracing ====================
+
+    def _toggle_tracing(self):
+        """Performance > Show Timings: record stages and show the breakdown."""
+        if self.tracing_enabled.get():
+            TRACER.enable()
+            self._set_status("Timing enabled: breakdown of the last edit/redraw in the status bar")
+        else:
+            TRACER.disable()
+            self._edit_trace = ""
+            self.trace_text.set("")
+
+    def _note_trace(self):
+        """Remember the breakdown of the action that just ran (shown with the next redraw)."""
+        if TRACER.enabled:
+            self._edit_trace = TRACER.last_breakdown()
+
+    def _show_trace(self, prefix=""):
+        """Put the last top-level stage's breakdown into the status bar."""
+        if not TRACER.enabled:
+            return
+        text = TRACER.last_breakdown()
+        self.trace_text.set(f"{prefix} | {text}" if prefix else text)
+
+    def export_trace(self):
+        """Save the recorded session as Chrome trace_event JSON."""
+        if not TRACER.events():
+            messagebox.showinfo("Export Trace",
+                                "No trace recorded yet. Enable Performance > Show Timings first.")
+            return
+        path = filedialog.asksaveasfilename(
+            defaultextension=".json",
+            filetypes=[("Chrome trace", "*.json")]
+        )
+        if not path:
+            return
+        try:
+            count = TRACER.export(path)
+            self._set_status(f"Trace exported ({count} events): {os.path.basename(path)} "
+                             "- open it in chrome://tracing or ui.perfetto.dev")
+        except Exception as e:
+            messagebox.showerror("Error", f"Failed to export trace:\n{str(e)}")
+
+    def show_cache_stats(self):
+        """Performance > Result Cache Stats: how often edits were answered from the cache."""
+        stats = self.processor.cache_stats()
+        messagebox.showinfo(
+            "Result Cache",
+            f"Hits: {stats.hits}\nMisses: {stats.misses} (hit rate {stats.hit_rate:.0%})\n"
+            f"Evictions: {stats.evictions}\n"
+            f"Entries: {stats.entries} ({stats.nbytes / 1e6:.1f} MB cached pixels)")
+
+    def _press(self, event):
+        if self.select_region.get():
+            self._start_region(event)
+        else:
+            self._start_pan(event)
+
+    def _drag(self, event):
+        if self._region_start is not None:
+            self._drag_region(event)
+        else:
+            self._pan(event)
+
+    def _release(self, event):
+        self._pan_start = None
+        if self._region_start is not None:
+            self._drag_region(event)
+            self._region_start = None
+            if self.region is not None:
+                x, y, w, h = self.region
+                self._set_status(f"Region: {w}x{h} at ({x}, {y}) - edits apply to it only")
+
+    def _start_pan(self, event):
+        if self.processor.has_image():
+            self._pan_start = (event.x, event.y, self._view()[1])
+
+    def _pan(self, event):
+        """Drag: move the view centre by the mouse movement (in image pixels)."""
+        if self._pan_start is None or not self.processor.has_image():
+            return
+        x, y, (cx, cy) = self._pan_start
+        scale = self._view()[0]
+        self.view_center = (cx - (event.x - x) / scale, cy - (event.y - y) / scale)
+        self._schedule_display()
+
+    # ==================== Region Selection ====================
+
+    def _to_image(self, sx, sy):
+        """Canvas point -> image point (full-resolution pixels)."""
+        scale, (cx, cy), (vw, vh) = self._view()
+        return cx + (sx - vw / 2) / scale, cy + (sy - vh / 2) / scale
+
+    def _start_region(self, event):
+        if self.processor.has_image():
+            self._region_start = self._to_image(event.x, event.y)
+
+    def _drag_region(self, event):
+        """Drag: the rectangle between the press point and the mouse, clipped to the image."""
+        (x0, y0), (x1, y1) = self._region_start, self._to_image(event.x, event.y)
+        shape = self.processor.snapshot().shape
+        left, top, right, bottom = region_rect(shape, min(x0, x1), min(y0, y1),
+                                               abs(x1 - x0), abs(y1 - y0))
+        self.region = (left, top, right - left, bottom - top) if right > left and bottom > top else None
+        self._draw_region()
+
+    def _draw_region(self):
+        """Outline of the selected region on the canvas (follows zoom and pan)."""
+        self.canvas.delete("region")
+        if self.region is None or not self.processor.has_image():
+            return
+        scale, (cx, cy), (vw, vh) = self._view()
+        x, y, w, h = self.region
+        left, top = (x - cx) * scale + vw / 2, (y - cy) * scale + vh / 2
+        self.canvas.create_rectangle(left, top, left + w * scale, top + h * scale,
+                                     outline="#FFEB3B", dash=(4, 2), width=2, tags="region")
+
+    def _keep_region(self):
+        """Drops the region if it no longer fits the image (e.g. undo of a resize)."""
+        if self.region is not None:
+            x, y, w, h = self.region
+            width, height = self.processor.get_dimensions()
+            if x + w > width or y + h > height:
+                self.clear_region()
+
+    def clear_region(self):
+        """Edits apply to the whole image again."""
+        self.region = None
+        self._region_start = None
+        self.canvas.delete("region")
+
+    def _in_region(self, name, params):
+        """(name, params) of an edit, restricted to the selected region if there is one."""
+        if self.region is None or name not in REGION_OPS:
+            return name, params
+        return "region", tuple(self.region) + (name, tuple(params))
+
+    def _schedule_display(self):
+        """
+        Ask for a redraw once Tk is idle.
+        Several edits in a row then share ONE evaluation + redraw.
+        """
+        if not self._redraw_pending:
+            self._redraw_pending = True
+            self.root.after_idle(self._refresh_display)
     
+    # ==================== Live Slider Preview ====================
+
+    def _slider_edit(self, kind):
+        """
+        Returns (op name, params, label) for the current slider value,
+        or None if the sliders are not valid (e.g. t1 >= t2).
+        """
+        if kind == "blur":
+            k = self.blur_slider.get()
+            return "blur", (k,), f"Blur (kernel size: {k})"
+        if kind == "brightness":
+            value = self.brightness_slider.get()
+            return "brightness", (value,), f"Brightness ({value:+d})"
+        if kind == "contrast":
+            value = self.contrast_slider.get()
+            return "contrast", (value,), f"Contrast ({value:.1f}x)"
+        t1, t2 = self.edge_t1.get(), self.edge_t2.get()
+        if t1 >= t2:
+            return None
+        return "edges", (t1, t2), f"Edge Detection (t1={t1}, t2={t2})"
+
+    def _schedule_preview(self, kind):
+        """
+        Slider callback: restart a short timer (debounce), so dragging a
+        slider does not start a new preview for every pixel moved.
+        """
+        if not self.processor.has_image():
+            return
+        if self._preview_after_id is not None:
+            self.root.after_cancel(self._preview_after_id)
+        self._preview_after_id = self.root.after(
+            PREVIEW_DEBOUNCE_MS, lambda: self._start_preview(kind))
+
+    def _start_preview(self, kind):
+        """Send the preview to the worker thread (replaces any older one)."""
+        self._preview_after_id = None
+        edit = self._slider_edit(kind)
+        if edit is None or not self.processor.has_image():
+            return
+        name, params, label = edit
+        name, params = self._in_region(name, params)
+        self.preview_worker.submit(
+            lambda img: self._show_preview(img, label),
+            self.processor.preview, self.display.max_w, self.display.max_h, name, *params)
+
+    def _show_preview(self, image, label):
+        """Runs on the Tk thread when the newest preview is ready."""
+        self.show_image(image)
+        self._set_status(f"Preview: {label} - click Apply to keep")
+
+    def _cancel_preview(self):
+        """Forget pending previews (the image is about to change)."""
+        if self._preview_after_id is not None:
+            self.root.after_cancel(self._preview_after_id)
+            self._preview_after_id = None
+        self.preview_worker.cancel()
+
     # ==================== Edit Operations ====================
     
     def undo(self):
         """Undo the last operation"""
-        img = self.history.undo()
-        if img is not None:
-            self.processor.set_image(img)
-            self.show_image(img)
+        self._cancel_preview()
+        state = self.history.undo()
+        self._note_trace()
+        if state is not None:
+            self.processor.set_image(state)
+            self._keep_region()
+            self._schedule_display()
             self._set_status("Undo successful")
         else:
             messagebox.showinfo("Info", "Nothing to undo!")
     
     def redo(self):
         """Redo the last undone operation"""
-        img = self.history.redo()
-        if img is not None:
-            self.processor.set_image(img)
-            self.show_image(img)
+        self._cancel_preview()
+        state = self.history.redo()
+        self._note_trace()
+        if state is not None:
+            self.processor.set_image(state)
+            self._keep_region()
+            self._schedule_display()
             self._set_status("Redo successful")
         else:
             messagebox.showinfo("Info", "Nothing to redo!")
@@ -413,42 +873,54 @@ class ImageEditorApp:
             return
         
         if messagebox.askyesno("Reset", "Reset to original image?"):
-            self.processor.set_image(self.original_image.copy())
+            self._cancel_preview()
+            self.processor.set_image(self.original_image)
             self.history.reset()
-            self.history.push(self.original_image.copy())
-            self.show_image(self.original_image)
+            self.history.push(self.processor.snapshot())
             self.zoom_factor = 1.0
+            self.view_center = None
+            self.clear_region()
+            self._refresh_display()
             self._set_status("Image reset to original")
     
     # ==================== Image Processing Methods ====================
+
+    def _apply_edit(self, name, *params):
+        """
+        Record an edit lazily, store it in history and schedule a redraw.
+        Nothing runs at full resolution here - pixels are computed only
+        when they are needed (display, save).
+
+        Returns False (after warning the user) if no image is loaded.
+        """
+        if not self.processor.has_image():
+            messagebox.showwarning("Warning", "Please load an image first!")
+            return False
+        self._cancel_preview()
+        if name in GEOMETRY_OPS:
+            self.clear_region()  # its coordinates no longer fit
+        name, params = self._in_region(name, params)
+        with TRACER.span(f"edit:{name}", "app"):
+            self.processor.record(name, *params)
+            # History stores only the command; the snapshot is kept as "current"
+            self.history.push_command(name, params, self.processor.snapshot())
+        self._note_trace()
+        self._schedule_display()
+        return True
     
     def apply_grayscale(self):
         """Apply grayscale filter"""
-        if self.processor.get_image() is None:
-            messagebox.showwarning("Warning", "Please load an image first!")
-            return
-        
-        img = self.processor.grayscale()
-        self.processor.set_image(img)
-        self.history.push(img.copy())
-        self.show_image(img)
-        self._set_status("Applied: Grayscale")
+        if self._apply_edit("grayscale"):
+            self._set_status("Applied: Grayscale")
     
     def apply_edges(self):
         """Apply Canny edge detection"""
-        if self.processor.get_image() is None:
-            messagebox.showwarning("Warning", "Please load an image first!")
-            return
-        
-        img = self.processor.edges()
-        self.processor.set_image(img)
-        self.history.push(img.copy())
-        self.show_image(img)
-        self._set_status("Applied: Edge Detection (Canny)")
+        if self._apply_edit("edges"):
+            self._set_status("Applied: Edge Detection (Canny)")
 
     def apply_edges_slider(self):
         """Apply Canny edge detection using threshold sliders"""
-        if self.processor.get_image() is None:
+        if not self.processor.has_image():
             messagebox.showwarning("Warning", "Please load an image first!")
             return
 
@@ -459,115 +931,85 @@ class ImageEditorApp:
             messagebox.showerror("Error", "Threshold 1 must be less than Threshold 2.")
             return
 
-        img = self.processor.edges(t1, t2)
-        self.processor.set_image(img)
-        self.history.push(img.copy())
-        self.show_image(img)
-        self._set_status(f"Applied: Edge Detection (t1={t1}, t2={t2})")
+        if self._apply_edit("edges", t1, t2):
+            self._set_status(f"Applied: Edge Detection (t1={t1}, t2={t2})")
 
     
     def apply_blur(self):
         """Apply Gaussian blur with adjustable intensity"""
-        if self.processor.get_image() is None:
-            messagebox.showwarning("Warning", "Please load an image first!")
-            return
-        
         kernel_size = self.blur_slider.get()
-        img = self.processor.blur(kernel_size)
-        self.processor.set_image(img)
-        self.history.push(img.copy())
-        self.show_image(img)
-        self._set_status(f"Applied: Blur (kernel size: {kernel_size})")
+        if self._apply_edit("blur", kernel_size):
+            self._set_status(f"Applied: Blur (kernel size: {kernel_size})")
     
     def apply_brightness(self):
         """Apply brightness adjustment"""
-        if self.processor.get_image() is None:
-            messagebox.showwarning("Warning", "Please load an image first!")
-            return
-        
         value = self.brightness_slider.get()
-        img = self.processor.brightness(value)
-        self.processor.set_image(img)
-        self.history.push(img.copy())
-        self.show_image(img)
-        self._set_status(f"Applied: Brightness ({value:+d})")
+        if self._apply_edit("brightness", value):
+            self._set_status(f"Applied: Brightness ({value:+d})")
     
     def apply_contrast(self):
         """Apply contrast adjustment"""
-        if self.processor.get_image() is None:
-            messagebox.showwarning("Warning", "Please load an image first!")
-            return
-        
         value = self.contrast_slider.get()
-        img = self.processor.contrast(value)
-        self.processor.set_image(img)
-        self.history.push(img.copy())
-        self.show_image(img)
-        self._set_status(f"Applied: Contrast ({value:.1f}x)")
+        if self._apply_edit("contrast", value):
+            self._set_status(f"Applied: Contrast ({value:.1f}x)")
     
     def apply_rotation(self, angle):
         """Apply rotation by specified angle (90, 180, or 270 degrees)"""
-        if self.processor.get_image() is None:
-            messagebox.showwarning("Warning", "Please load an image first!")
-            return
-        
-        img = self.processor.rotate(angle)
-        self.processor.set_image(img)
-        self.history.push(img.copy())
-        self.show_image(img)
-        self._set_status(f"Applied: Rotation ({angle}°)")
+        if self._apply_edit("rotate", angle):
+            self._set_status(f"Applied: Rotation ({angle}°)")
     
     def apply_flip(self, direction):
         """Apply flip (horizontal or vertical)"""
-        if self.processor.get_image() is None:
-            messagebox.showwarning("Warning", "Please load an image first!")
-            return
         mode = "h" if direction == "horizontal" else "v"
-        img = self.processor.flip(mode)
-        self.processor.set_image(img)
-        self.history.push(img.copy())
-        self.show_image(img)
-        self._set_status(f"Applied: Flip ({direction})")
+        if self._apply_edit("flip", mode):
+            self._set_status(f"Applied: Flip ({direction})")
     
     def apply_resize(self):
         """Apply resize/scale based on percentage"""
-        if self.processor.get_image() is None:
-            messagebox.showwarning("Warning", "Please load an image first!")
-            return
-        
         scale_percent = self.resize_slider.get()
         scale_factor = scale_percent / 100.0
-        img = self.processor.resize(scale_factor)
-        self.processor.set_image(img)
-        self.history.push(img.copy())
-        self.show_image(img)
-        h, w = img.shape[:2]
-        self._set_status(f"Applied: Resize ({scale_percent}%) | New size: {w}x{h}")
+        if self._apply_edit("resize", scale_factor, self.resize_quality.get()):
+            # New size is known without running the resize
+            w, h = self.processor.get_dimensions()
+            self._set_status(f"Applied: Resize ({scale_percent}%) | New size: {w}x{h}")
 
     def zoom_in(self):
-        if self.processor.get_image() is None:
+        if not self.processor.has_image():
             messagebox.showwarning("Warning", "Please load an image first!")
             return
         self.zoom_factor *= 1.25
-        self.show_image(self.processor.get_image())
+        self._render_skipped = None
+        self._schedule_display()
         self._set_status(f"Zoom: {int(self.zoom_factor * 100)}%")
 
     def zoom_out(self):
-        if self.processor.get_image() is None:
+        if not self.processor.has_image():
             messagebox.showwarning("Warning", "Please load an image first!")
             return
         self.zoom_factor /= 1.25
-        self.show_image(self.processor.get_image())
+        self._schedule_display()
         self._set_status(f"Zoom: {int(self.zoom_factor * 100)}%")
 
     def zoom_reset(self):
-        if self.processor.get_image() is None:
+        if not self.processor.has_image():
             messagebox.showwarning("Warning", "Please load an image first!")
             return
         self.zoom_factor = 1.0
-        self.show_image(self.processor.get_image())
+        self.view_center = None
+        self._schedule_display()
         self._set_status("Zoom reset to 100%")
 
+    def zoom_actual(self):
+        """Zoom to 1:1 - one image pixel per screen pixel (keeps the view centre)."""
+        if not self.processor.has_image():
+            messagebox.showwarning("Warning", "Please load an image first!")
+            return
+        w, h = self.processor.get_dimensions()
+        self.zoom_factor = 1.0 / fit_scale(w, h, *self._viewport())
+        self._render_skipped = None
+        self._schedule_display()
+        self._set_status(f"Zoom: actual pixels ({int(self.zoom_factor * 100)}%)")
+
 # ==================== Main Execution ====================
 
 if __name__ == "__main__":
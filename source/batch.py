@@ -0,0 +1,267 @@
+"""
+Headless batch processing (no GUI).
+
+Applies a recipe of ImageProcessor operations to a folder of images,
+using a pool of worker processes.
+
+Example:
+    python batch.py photos/ out/ --recipe "grayscale -> blur 5 -> resize 0.5" --workers 4
+    python batch.py "scans/*.png" out/ --recipe "contrast 1.3, edges"
+    python batch.py photos/ out/ --recipe "blur 9" --stream
+
+--stream uses the threaded reader -> worker -> writer pipeline (pipeline.py)
+instead of the process pool, so decoding, filtering and encoding overlap.
+
+Why a separate entry point:
+- main.py starts Tkinter, which is not available on servers.
+  This file only imports the image processing modules, never tkinter.
+"""
+
+from __future__ import annotations
+
+import argparse
+import glob
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import List, NamedTuple, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+import operations
+from image_processor import ImageProcessor
+
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+
+# Side of the blank image parse_recipe() tries a recipe on
+DRY_RUN_SIZE = 16
+
+Recipe = Tuple[Tuple[str, Tuple], ...]
+
+
+class BatchResult(NamedTuple):
+    """Outcome of processing one image."""
+
+    source: str
+    target: Optional[str]
+    seconds: float
+    megapixels: float
+    error: Optional[str] = None
+
+
+# ---------- Recipe parsing ----------
+
+def _parse_value(text: str):
+    for cast in (int, float):
+        try:
+            return cast(text)
+        except ValueError:
+            pass
+    return text
+
+
+def parse_recipe(text: str) -> Recipe:
+    """
+    Parses a recipe like "grayscale -> blur 5 -> resize 0.5".
+
+    Steps are separated by "->", "→", "," or ";".
+    Parameters follow the op name, separated by spaces or ":".
+
+    The recipe is tried once on a tiny image, so bad parameters
+    ("blur abc") are rejected here instead of failing on every image.
+    """
+    recipe = []
+    for part in re.split(r"->|→|,|;", text):
+        words = part.replace(":", " ").split()
+        if not words:
+            continue
+        name, params = words[0].lower(), tuple(_parse_value(w) for w in words[1:])
+        if not operations.is_known(name):
+            raise ValueError(f"Unknown operation in recipe: {name}")
+        recipe.append((name, params))
+    if not recipe:
+        raise ValueError("Recipe is empty.")
+    _dry_run(recipe)
+    return tuple(recipe)
+
+
+def _dry_run(recipe: Recipe) -> None:
+    """Runs the recipe step by step on a small blank image; raises ValueError on the first bad step."""
+    processor = ImageProcessor()
+    processor.set_image(np.zeros((DRY_RUN_SIZE, DRY_RUN_SIZE, 3), dtype=np.uint8))
+    for name, params in recipe:
+        try:
+            processor.record(name, *params)
+            processor.evaluate()
+        except Exception as e:
+            step = " ".join(str(p) for p in (name,) + tuple(params))
+            raise ValueError(f"Invalid recipe step '{step}': {e}") from e
+
+
+def find_images(source: str) -> List[str]:
+    """Returns the images in a directory, or the files matching a glob pattern."""
+    if os.path.isdir(source):
+        paths = [os.path.join(source, name) for name in os.listdir(source)]
+    else:
+        paths = glob.glob(source)
+    return sorted(p for p in paths if os.path.isfile(p) and p.lower().endswith(IMAGE_EXTENSIONS))
+
+
+def output_path(source: str, out_dir: str, fmt: Optional[str]) -> str:
+    """Output file name: same base name, optionally a different format."""
+    base, ext = os.path.splitext(os.path.basename(source))
+    return os.path.join(out_dir, base + ("." + fmt.lstrip(".") if fmt else ext))
+
+
+def output_paths(sources: Sequence[str], out_dir: str, fmt: Optional[str]) -> List[str]:
+    """
+    output_path() of every source. Raises ValueError if two sources would
+    be written to the same file (a.jpg and a.png with --format png, or
+    a.jpg in two directories): the later one would overwrite the earlier.
+    """
+    targets = [output_path(src, out_dir, fmt) for src in sources]
+    first: dict = {}
+    for src, target in zip(sources, targets):
+        key = os.path.normcase(target)
+        if key in first:
+            raise ValueError(f"{first[key]} and {src} would both be written to {target}")
+        first[key] = src
+    return targets
+
+
+# ---------- Worker side ----------
+
+def _init_worker() -> None:
+    # One OpenCV thread per process: the pool already uses every core.
+    cv2.setNumThreads(1)
+
+
+def process_image(source: str, target: str, recipe: Recipe) -> BatchResult:
+    """Loads one image, applies the recipe (fused, lazy) and saves it."""
+    start = time.perf_counter()
+    try:
+        processor = ImageProcessor()
+        processor.load(source)
+        w, h = processor.get_dimensions()
+        for name, params in recipe:
+            processor.record(name, *params)
+        processor.save(target)
+    except Exception as e:
+        return BatchResult(source, None, time.perf_counter() - start, 0.0, str(e))
+    return BatchResult(source, target, time.perf_counter() - start, w * h / 1e6)
+
+
+# ---------- Driver ----------
+
+def _check_workers(workers: Optional[int]) -> None:
+    if workers is not None and workers < 1:
+        raise ValueError(f"workers must be at least 1, got {workers}")
+
+
+def run_batch(sources: Sequence[str], out_dir: str, recipe: Recipe,
+              workers: Optional[int] = None, fmt: Optional[str] = None, log=print) -> List[BatchResult]:
+    """
+    Processes every image in `sources` across a process pool.
+    Prints one line per image and a summary at the end.
+    """
+    _check_workers(workers)
+    targets = output_paths(sources, out_dir, fmt)
+    os.makedirs(out_dir, exist_ok=True)
+    workers = workers or os.cpu_count() or 1
+    results: List[BatchResult] = []
+
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+        futures = [pool.submit(process_image, src, target, recipe)
+                   for src, target in zip(sources, targets)]
+        for future in as_completed(futures):
+            results.append(future.result())
+            _log_result(results[-1], log)
+    _log_summary(results, time.perf_counter() - start, workers, log)
+    return results
+
+
+def run_stream(sources: Sequence[str], out_dir: str, recipe: Recipe,
+               workers: Optional[int] = None, fmt: Optional[str] = None,
+               queue_size: Optional[int] = None, log=print) -> List[BatchResult]:
+    """Same as run_batch(), but through the streaming reader/worker/writer pipeline."""
+    from pipeline import StreamingPipeline  # pipeline.py imports this module
+
+    _check_workers(workers)
+    targets = output_paths(sources, out_dir, fmt)
+    os.makedirs(out_dir, exist_ok=True)
+    pipe = StreamingPipeline(recipe, workers=workers, queue_size=queue_size)
+    results: List[BatchResult] = []
+
+    start = time.perf_counter()
+    for r in pipe.run(zip(sources, targets)):
+        results.append(r)
+        _log_result(r, log)
+    _log_summary(results, time.perf_counter() - start, workers or os.cpu_count() or 1, log)
+    busy = ", ".join(f"{name} {sec:.2f} s" for name, sec in pipe.stage_seconds.items())
+    log(f"Stage busy time: {busy}")
+    return results
+
+
+def _log_result(r: BatchResult, log) -> None:
+    name = os.path.basename(r.source)
+    if r.error:
+        log(f"[fail] {name}: {r.error}")
+    else:
+        rate = r.megapixels / r.seconds if r.seconds > 0 else 0.0
+        log(f"[ok]   {name}: {r.megapixels:.1f} MP in {r.seconds:.3f} s ({rate:.1f} MP/s)")
+
+
+def _log_summary(results: Sequence[BatchResult], wall: float, workers: int, log) -> None:
+    done = [r for r in results if not r.error]
+    total_mp = sum(r.megapixels for r in done)
+    log(f"Processed {len(done)}/{len(results)} images ({total_mp:.1f} MP) in {wall:.2f} s "
+        f"with {workers} worker(s): {len(done) / wall if wall else 0:.2f} images/s, "
+        f"{total_mp / wall if wall else 0:.1f} MP/s")
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Apply an ImageProcessor recipe to many images (no GUI).")
+    parser.add_argument("input", help="input directory or glob pattern (quote it)")
+    parser.add_argument("output", help="output directory")
+    parser.add_argument("--recipe", required=True,
+                        help='operations in order, e.g. "grayscale -> blur 5 -> resize 0.5"')
+    parser.add_argument("--workers", type=int, default=None, help="worker processes, or worker threads with --stream (default: CPU count)")
+    parser.add_argument("--format", dest="fmt", default=None, help="output format, e.g. png or jpg")
+    parser.add_argument("--stream", action="store_true",
+                        help="use the threaded decode -> process -> encode pipeline")
+    parser.add_argument("--queue-size", type=int, default=None,
+                        help="max images waiting between pipeline stages (with --stream)")
+    args = parser.parse_args(argv)
+    if args.workers is not None and args.workers < 1:
+        parser.error("--workers must be at least 1")
+    if args.queue_size is not None and args.queue_size < 1:
+        parser.error("--queue-size must be at least 1")
+
+    try:
+        recipe = parse_recipe(args.recipe)
+    except ValueError as e:
+        parser.error(str(e))
+
+    sources = find_images(args.input)
+    if not sources:
+        print(f"No images found in: {args.input}", file=sys.stderr)
+        return 1
+    try:
+        output_paths(sources, args.output, args.fmt)
+    except ValueError as e:
+        parser.error(f"{e}; rename one of them")
+
+    if args.stream:
+        results = run_stream(sources, args.output, recipe, args.workers, args.fmt, args.queue_size)
+    else:
+        results = run_batch(sources, args.output, recipe, args.workers, args.fmt)
+    return 0 if all(not r.error for r in results) else 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,251 @@
+"""
+Benchmark harness for the ImageProcessor operations (no GUI, no network).
+
+Times grayscale, blur, edges, brightness, contrast, rotate, flip and resize
+on synthetic images from 1 MP to 100 MP and reports ms/op, megapixels/s
+and peak memory. Results can be written to JSON and compared against a
+stored baseline, failing (exit code 1) on regressions.
+
+Example:
+    python benchmark.py --sizes 1,12,50 --json results.json
+    python benchmark.py --baseline results.json --threshold 0.15
+    python benchmark.py --ops blur,edges --tiled
+
+Why:
+- without numbers, performance changes land blind. Saving a baseline
+  before a change and comparing after it shows what got faster or slower.
+
+Canny cache:
+- edges() keeps the gradients of the image it last saw (canny.CACHE), so
+  running it again on the same image only redoes the thresholds. Every
+  timed run starts with an empty cache, so "edges" is the full Canny cost;
+  "edges_cached" times a threshold change on a warm cache, separately.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+from typing import Callable, Dict, List, NamedTuple, Optional, Sequence
+
+import cv2
+import numpy as np
+
+import canny
+from image_processor import ImageProcessor
+from op_graph import LazyImage
+
+
+DEFAULT_SIZES = (1, 4, 12, 25, 50, 100)  # megapixels
+
+# name -> call on a loaded ImageProcessor
+OPERATIONS: Dict[str, Callable[[ImageProcessor], object]] = {
+    "grayscale": lambda p: p.grayscale(),
+    "blur": lambda p: p.blur(15),
+    "edges": lambda p: p.edges(50, 150),
+    "edges_cached": lambda p: p.edges(60, 140),
+    "brightness": lambda p: p.brightness(40),
+    "contrast": lambda p: p.contrast(1.5),
+    "rotate": lambda p: p.rotate(90),
+    "flip": lambda p: p.flip("h"),
+    "resize": lambda p: p.resize(0.5),
+}
+
+# name -> untimed call before each run (default: empty the Canny cache)
+SETUP: Dict[str, Callable[[ImageProcessor], object]] = {
+    "edges_cached": lambda p: (canny.CACHE.clear(), p.edges(50, 150)),
+}
+
+
+def _clear_canny_cache(processor: ImageProcessor) -> None:
+    canny.CACHE.clear()
+
+
+class BenchResult(NamedTuple):
+    """Timing of one operation at one image size."""
+
+    op: str
+    megapixels: float
+    width: int
+    height: int
+    ms: float       # median
+    ms_min: float
+    mp_per_s: float
+    peak_mb: float  # extra memory at peak while the op runs
+
+
+# ---------- Synthetic images ----------
+
+def synthetic_image(megapixels: float, seed: int = 0):
+    """
+    A 4:3 BGR test image: smooth random shapes (photo-like gradients and
+    edges), the same for every run with the same seed.
+    """
+    width = int(round((megapixels * 1e6 * 4 / 3) ** 0.5))
+    height = int(round(megapixels * 1e6 / width))
+    rng = np.random.default_rng(seed)
+    coarse = rng.integers(0, 256, (height // 16 + 2, width // 16 + 2, 3), dtype=np.uint8)
+    return cv2.resize(coarse, (width, height), interpolation=cv2.INTER_LINEAR)
+
+
+# ---------- Measuring ----------
+
+def time_op(fn: Callable[[], object], warmup: int, repeat: int,
+            setup: Optional[Callable[[], object]] = None) -> List[float]:
+    """
+    Runs fn `warmup` times untimed, then returns `repeat` timings (seconds).
+    setup (if given) runs untimed before every call.
+    """
+    for _ in range(warmup):
+        if setup is not None:
+            setup()
+        fn()
+    times = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def peak_memory(fn: Callable[[], object], setup: Optional[Callable[[], object]] = None) -> float:
+    """
+    Extra memory (MB) at the peak of one run of fn.
+    Measured in a separate run: tracing slows allocations down.
+    NumPy (and the arrays OpenCV returns) report to tracemalloc; OpenCV's
+    internal temporary buffers do not.
+    """
+    if setup is not None:
+        setup()
+    tracemalloc.start()
+    try:
+        tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+        result = fn()
+        peak = tracemalloc.get_traced_memory()[1]
+        del result
+    finally:
+        tracemalloc.stop()
+    return (peak - base) / 1e6
+
+
+def run_benchmarks(sizes: Sequence[float], ops: Sequence[str], warmup: int = 1, repeat: int = 5,
+                   tiled: bool = False, log=print) -> List[BenchResult]:
+    results: List[BenchResult] = []
+    for mp in sizes:
+        image = synthetic_image(mp)
+        height, width = image.shape[:2]
+        real_mp = width * height / 1e6
+        processor = ImageProcessor()
+        if tiled:
+            processor.enable_tiling()
+        processor.set_image(LazyImage(image))
+
+        for name in ops:
+            fn = lambda: OPERATIONS[name](processor)
+            setup = lambda: SETUP.get(name, _clear_canny_cache)(processor)
+            times = time_op(fn, warmup, repeat, setup)
+            ms = statistics.median(times) * 1000
+            r = BenchResult(name, round(real_mp, 2), width, height, round(ms, 3),
+                            round(min(times) * 1000, 3), round(real_mp / (ms / 1000), 1),
+                            round(peak_memory(fn, setup), 1))
+            results.append(r)
+            log(f"{r.op:<12} {r.megapixels:>6.1f} MP  {r.ms:>9.2f} ms  "
+                f"{r.mp_per_s:>8.1f} MP/s  peak {r.peak_mb:>7.1f} MB")
+        processor.disable_tiling()
+    return results
+
+
+# ---------- JSON / baseline ----------
+
+def environment() -> Dict[str, object]:
+    return {
+        "python": platform.python_version(),
+        "opencv": cv2.__version__,
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+
+
+def write_json(path: str, results: Sequence[BenchResult], settings: Dict[str, object]) -> None:
+    data = {"environment": environment(), "settings": settings,
+            "results": [r._asdict() for r in results]}
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2)
+
+
+def compare(results: Sequence[BenchResult], baseline_path: str, threshold: float,
+            log=print) -> List[str]:
+    """
+    Compares median times with a baseline JSON file.
+    Returns the regressions: ops at least `threshold` (e.g. 0.15 = 15 %) slower.
+    """
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = {(r["op"], r["megapixels"]): r for r in json.load(f)["results"]}
+
+    regressions = []
+    for r in results:
+        base = baseline.get((r.op, r.megapixels))
+        if base is None or base["ms"] <= 0:
+            continue
+        change = r.ms / base["ms"] - 1.0
+        line = f"{r.op:<12} {r.megapixels:>6.1f} MP  {base['ms']:>9.2f} -> {r.ms:>9.2f} ms  ({change:+.1%})"
+        if change > threshold:
+            regressions.append(line)
+            line += "  REGRESSION"
+        log(line)
+    return regressions
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark ImageProcessor operations (no GUI).")
+    parser.add_argument("--sizes", default=",".join(str(s) for s in DEFAULT_SIZES),
+                        help="image sizes in megapixels, comma separated (default: %(default)s)")
+    parser.add_argument("--ops", default=",".join(OPERATIONS),
+                        help="operations to time, comma separated (default: all)")
+    parser.add_argument("--warmup", type=int, default=1, help="untimed runs first (default: 1)")
+    parser.add_argument("--repeat", type=int, default=5, help="timed runs (default: 5)")
+    parser.add_argument("--tiled", action="store_true", help="enable tiled execution")
+    parser.add_argument("--json", dest="json_path", default=None, help="write results to this file")
+    parser.add_argument("--baseline", default=None, help="baseline JSON file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.15,
+                        help="allowed slowdown vs the baseline (default: 0.15 = 15%%)")
+    args = parser.parse_args(argv)
+
+    try:
+        sizes = [float(s) for s in args.sizes.split(",") if s.strip()]
+    except ValueError:
+        parser.error("--sizes must be numbers, e.g. 1,12,50")
+    ops = [name.strip() for name in args.ops.split(",") if name.strip()]
+    unknown = [name for name in ops if name not in OPERATIONS]
+    if unknown:
+        parser.error(f"Unknown operation(s): {', '.join(unknown)}")
+
+    results = run_benchmarks(sizes, ops, max(0, args.warmup), max(1, args.repeat), args.tiled)
+
+    if args.json_path:
+        write_json(args.json_path, results, {"warmup": args.warmup, "repeat": args.repeat,
+                                             "tiled": args.tiled})
+        print(f"Results written to {args.json_path}")
+
+    if args.baseline:
+        regressions = compare(results, args.baseline, args.threshold)
+        if regressions:
+            print(f"{len(regressions)} regression(s) above {args.threshold:.0%}", file=sys.stderr)
+            return 1
+        print("No regressions.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
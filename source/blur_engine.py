@@ -0,0 +1,117 @@
+"""
+Blur engine: a Gaussian blur whose cost does not grow with the radius.
+
+cv2.GaussianBlur does work proportional to the kernel size for every
+pixel: fine for small kernels, seconds for a 400 px blur on a big photo.
+Here the strategy is picked from the Gaussian's sigma (OpenCV's formula for
+a k x k kernel):
+
+- "direct" (sigma <= 5, kernels up to 31): cv2.GaussianBlur itself, which
+  is separable (two 1-D passes). Exact.
+- "box" (sigma < 12): four passes of a box filter. cv2.blur keeps running
+  sums, so a pass costs the same for any width; the widths are chosen so
+  their variances add up to the Gaussian's (Kovesi, "Fast Almost-Gaussian
+  Filtering", 2010).
+- "pyramid" (larger): average down by a power of two f, blur there with
+  sigma / f (at least 6, so the small image is still smooth enough), and
+  interpolate back up. The work shrinks with f**2, so a blur with a radius
+  in the hundreds of pixels is cheaper than a small one.
+
+Tolerance (compared with cv2.GaussianBlur with the same kernel, 8-bit):
+the mean absolute difference stays below 1 level on photos (below 2 on
+high-contrast periodic patterns); single pixels may differ by a few levels.
+"""
+
+from __future__ import annotations
+
+import math
+from typing import List, Optional
+
+import cv2
+import numpy as np
+
+
+DIRECT_MAX_SIGMA = 5.0   # kernel size 31
+BOX_MAX_SIGMA = 12.0     # kernel size 77
+BOX_PASSES = 4
+PYRAMID_MIN_SIGMA = 6.0  # sigma left to blur at the reduced size
+
+
+def kernel_size(intensity) -> int:
+    """OpenCV needs an odd kernel size: 4 -> 5, 0 -> 1."""
+    k = max(1, int(intensity))
+    return k if k % 2 else k + 1
+
+
+def sigma_for(ksize: int) -> float:
+    """The sigma cv2.GaussianBlur uses for a ksize x ksize kernel (sigma=0)."""
+    return 0.3 * ((ksize - 1) * 0.5 - 1) + 0.8
+
+
+def strategy(ksize: int) -> str:
+    """"direct", "box" or "pyramid" (see the module docstring)."""
+    sigma = sigma_for(ksize)
+    if sigma <= DIRECT_MAX_SIGMA:
+        return "direct"
+    if sigma < BOX_MAX_SIGMA:
+        return "box"
+    return "pyramid"
+
+
+def box_widths(sigma: float, passes: int = BOX_PASSES) -> List[int]:
+    """Odd box widths whose repeated application approximates the Gaussian."""
+    ideal = math.sqrt(12 * sigma * sigma / passes + 1)
+    low = int(ideal)
+    if low % 2 == 0:
+        low -= 1
+    # Number of passes using `low` (the rest use low + 2), matching the variance
+    m = round((12 * sigma * sigma - passes * low * low - 4 * passes * low - 3 * passes)
+              / (-4 * low - 4))
+    m = min(max(m, 0), passes)
+    return [low] * m + [low + 2] * (passes - m)
+
+
+def halo(ksize: int) -> Optional[int]:
+    """
+    How far (in pixels) the blur reaches, for tiled execution.
+    None for the pyramid strategy: its result depends on where the image
+    starts (the grid it is averaged down on), so it cannot be tiled.
+    """
+    kind = strategy(ksize)
+    if kind == "direct":
+        return ksize // 2
+    if kind == "box":
+        return sum(w // 2 for w in box_widths(sigma_for(ksize)))
+    return None
+
+
+def gaussian(image, ksize: int):
+    """Blurs like cv2.GaussianBlur(image, (ksize, ksize), 0), picking the fastest strategy."""
+    kind = strategy(ksize)
+    if kind == "direct":
+        return cv2.GaussianBlur(image, (ksize, ksize), 0)
+    sigma = sigma_for(ksize)
+    if kind == "box":
+        for w in box_widths(sigma):
+            image = cv2.blur(image, (w, w))
+        return image
+    return _pyramid(image, sigma)
+
+
+def _pyramid(image, sigma: float):
+    f = 2
+    while sigma / (2 * f) >= PYRAMID_MIN_SIGMA:
+        f *= 2
+    h, w = image.shape[:2]
+    # Pad to a multiple of f (mirrored, like the other strategies' borders)
+    # so the reduction is an exact f x f average
+    pad_h, pad_w = -h % f, -w % f
+    padded = cv2.copyMakeBorder(image, 0, pad_h, 0, pad_w, cv2.BORDER_REFLECT_101) \
+        if pad_h or pad_w else image
+    small = cv2.resize(padded, (padded.shape[1] // f, padded.shape[0] // f),
+                       interpolation=cv2.INTER_AREA)
+    # The f x f average already blurred by variance (f**2 - 1) / 12
+    rest = math.sqrt(max(sigma * sigma - (f * f - 1) / 12.0, 0.25)) / f
+    small = cv2.GaussianBlur(small, (0, 0), rest)
+    up = cv2.resize(small, (padded.shape[1], padded.shape[0]), interpolation=cv2.INTER_LINEAR)
+    return np.ascontiguousarray(up[:h, :w]) if pad_h or pad_w else up
@@ -0,0 +1,200 @@
+"""
+Canny edge detection split into its stages.
+
+cv2.Canny does everything in one call. Here the same algorithm is split in two:
+1) suppressed_magnitude(): Sobel gradients + non-maximum suppression.
+   Only needs a 2-pixel neighbourhood, so it can run tile by tile.
+2) hysteresis(): double threshold + keep weak edges connected to strong ones.
+   This is the only global step.
+
+The maths follows OpenCV exactly (L1 gradient, same fixed-point angle test,
+same border handling), so canny() gives the same pixels as cv2.Canny.
+
+Incremental thresholds:
+- only the thresholds change while the user drags the edge sliders, so the
+  threshold-independent stages are cached per image (StageCache, CACHE):
+  the Sobel gradients for whole-image runs (cv2.Canny accepts them and then
+  only does suppression + hysteresis) and the suppressed magnitude for
+  tiled runs (only classify() + hysteresis run again).
+"""
+
+from __future__ import annotations
+
+import threading
+import weakref
+from collections import OrderedDict
+from typing import Callable, Tuple
+
+import cv2
+import numpy as np
+
+
+# tan(22.5 deg) in 15-bit fixed point, same constant as OpenCV.
+_TG22 = 13573
+_SHIFT = 15
+
+# Pixels of context suppressed_magnitude() needs around a region.
+HALO = 2
+
+
+def thresholds(t1, t2) -> Tuple[int, int]:
+    """Normalises thresholds like cv2.Canny (swap if reversed, floor to int)."""
+    low, high = sorted((float(t1), float(t2)))
+    return int(np.floor(low)), int(np.floor(high))
+
+
+# Memory the stage cache may hold (gradients take 4 bytes per pixel)
+DEFAULT_CACHE_BYTES = 256 * 1024 * 1024
+
+
+def to_gray(image):
+    return image if image.ndim == 2 else cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+
+
+def gradients(gray):
+    """Sobel dx, dy (int16) exactly as cv2.Canny computes them internally."""
+    dx = cv2.Sobel(gray, cv2.CV_16S, 1, 0, ksize=3, borderType=cv2.BORDER_REPLICATE)
+    dy = cv2.Sobel(gray, cv2.CV_16S, 0, 1, ksize=3, borderType=cv2.BORDER_REPLICATE)
+    return dx, dy
+
+
+def suppressed_magnitude(gray):
+    """
+    Gradient magnitude (|dx| + |dy|) with non-maximum pixels set to 0.
+    Returns uint16 (the largest possible value is 2040).
+
+    Why keep this separately:
+    - it does not depend on the thresholds, so it can be cached and only
+      hysteresis() needs to run again when thresholds change.
+    """
+    dx, dy = (d.astype(np.int32) for d in gradients(gray))
+    ax = np.abs(dx)
+    ay = np.abs(dy)
+    mag = ax + ay
+
+    # Neighbour magnitudes (0 outside the image, like OpenCV).
+    p = np.pad(mag, 1)
+    left, right = p[1:-1, :-2], p[1:-1, 2:]
+    up, down = p[:-2, 1:-1], p[2:, 1:-1]
+
+    # Gradient direction bucket, fixed-point like OpenCV.
+    y = ay << _SHIFT
+    tg22x = ax * _TG22
+    tg67x = tg22x + (ax << (_SHIFT + 1))
+    horizontal = y < tg22x
+    vertical = ~horizontal & (y > tg67x)
+    diagonal = ~(horizontal | vertical)
+
+    # Diagonal neighbours depend on whether dx and dy have the same sign.
+    opposite = (dx ^ dy) < 0
+    diag_prev = np.where(opposite, p[:-2, 2:], p[:-2, :-2])
+    diag_next = np.where(opposite, p[2:, :-2], p[2:, 2:])
+
+    keep = (
+        (horizontal & (mag > left) & (mag >= right))
+        | (vertical & (mag > up) & (mag >= down))
+        | (diagonal & (mag > diag_prev) & (mag > diag_next))
+    )
+    return np.where(keep, mag, 0).astype(np.uint16)
+
+
+def classify(suppressed, low: int, high: int):
+    """Returns uint8 map: 0 = not an edge, 1 = weak candidate, 2 = strong."""
+    return (suppressed > low).astype(np.uint8) + (suppressed > high)
+
+
+def hysteresis(suppressed, low: int, high: int):
+    """
+    Double threshold + hysteresis.
+    Weak candidates survive only if they are 8-connected to a strong pixel.
+    Returns uint8 edges (0 / 255).
+    """
+    classes = classify(suppressed, low, high)
+    count, labels = cv2.connectedComponents((classes > 0).astype(np.uint8), connectivity=8)
+    strong = np.zeros(count, dtype=bool)
+    strong[labels[classes == 2]] = True
+    strong[0] = False
+    return np.where(strong[labels], 255, 0).astype(np.uint8)
+
+
+def canny(gray, t1, t2):
+    """Same result as cv2.Canny(gray, t1, t2)."""
+    low, high = thresholds(t1, t2)
+    return hysteresis(suppressed_magnitude(gray), low, high)
+
+
+def edges(image, t1, t2):
+    """
+    Same result as cv2.Canny on the grayscale of `image`; the gradients of a
+    read-only image are cached, so other thresholds on it skip grayscale + Sobel.
+    """
+    dx, dy = CACHE.get(image, "gradients", lambda: gradients(to_gray(image)))
+    return cv2.Canny(dx, dy, *thresholds(t1, t2))
+
+
+# ---------- Stage cache ----------
+
+def _nbytes(value) -> int:
+    if isinstance(value, tuple):
+        return sum(item.nbytes for item in value)
+    return value.nbytes
+
+
+class StageCache:
+    """
+    Threshold-independent Canny stages of recently used images.
+
+    Keyed by the input array itself: only READ-ONLY arrays are cached (the
+    op graph's pixels - one array per image version, never modified), and an
+    entry disappears with its array. The least recently used entries are
+    dropped beyond max_bytes.
+    """
+
+    def __init__(self, max_bytes: int = DEFAULT_CACHE_BYTES) -> None:
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[Tuple[int, str], Tuple[weakref.ref, object]]" = OrderedDict()
+        self._nbytes = 0
+        self._lock = threading.RLock()  # the weakref callback may run inside get()
+
+    def get(self, image, kind: str, compute: Callable[[], object]):
+        """Cached `kind` stage of `image`, computed with compute() on a miss."""
+        if image.flags.writeable:
+            return compute()  # the pixels could change under the same array
+        key = (id(image), kind)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0]() is image:
+                self._entries.move_to_end(key)
+                return entry[1]
+        value = compute()
+        size = _nbytes(value)
+        if size > self.max_bytes:
+            return value
+        with self._lock:
+            self._drop(key)
+            self._entries[key] = (weakref.ref(image, lambda _, key=key: self.discard(key)), value)
+            self._nbytes += size
+            while self._nbytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+        return value
+
+    def _drop(self, key) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._nbytes -= _nbytes(entry[1])
+
+    def discard(self, key) -> None:
+        with self._lock:
+            self._drop(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._nbytes = 0
+
+    @property
+    def nbytes(self) -> int:
+        return self._nbytes
+
+
+CACHE = StageCache()
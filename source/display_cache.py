@@ -0,0 +1,153 @@
+"""
+Display cache: an image pyramid of the current image, for drawing.
+
+Why this module exists:
+- every redraw used to convert BGR -> RGB and resample the image twice
+  (fit to the window, then zoom), and each zoom click started over.
+- here each pyramid level is rendered once per image version (i.e. once
+  per edit). A redraw then crops ONLY the visible part of the nearest level
+  that is at least as fine as the screen, resamples that crop once and
+  converts it to RGB. The cost is bounded by the window size, for a 1 MP
+  photo and a 100 MP scan alike, at any zoom.
+- level 0 is the real full-resolution image, so zooming in shows actual
+  pixels (1:1 inspection), not a magnified thumbnail.
+- a rotation / flip at the end of the edit chain is kept as a NumPy view
+  of the level (op_graph.orientation_view), so only the visible crop is
+  ever reoriented, even at full resolution.
+"""
+
+from __future__ import annotations
+
+import math
+from typing import Dict, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from op_graph import orientation_view
+from tracing import traced
+
+
+def to_rgb(image):
+    """BGR or single-channel pixels -> RGB (what PIL / Tk expect)."""
+    if image.ndim == 2:
+        return cv2.cvtColor(image, cv2.COLOR_GRAY2RGB)
+    return cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+
+
+def fit_scale(width: int, height: int, max_w: int, max_h: int) -> float:
+    """Scale that fits a width x height image inside max_w x max_h (never enlarged)."""
+    return min(max_w / width, max_h / height, 1.0)
+
+
+@traced("display.crop_view", "display")
+def crop_view(image, full_size: Tuple[int, int], scale: float,
+              center: Tuple[float, float], viewport: Tuple[int, int]):
+    """
+    The part of `image` visible in a viewport, resampled to screen size.
+
+    Args:
+        image: the whole picture at any resolution (a pyramid level, a preview)
+        full_size: (width, height) of the full-resolution image
+        scale: screen pixels per full-resolution pixel
+        center: full-resolution point shown in the middle of the viewport
+        viewport: (width, height) of the viewport
+
+    Returns:
+        (RGB pixels, (x, y) of their top-left corner in the viewport),
+        or None if nothing is visible.
+    """
+    width, height = full_size
+    vw, vh = viewport
+    cx, cy = center
+    # Visible rectangle in full-resolution coordinates
+    x0, x1 = max(0.0, cx - vw / (2 * scale)), min(float(width), cx + vw / (2 * scale))
+    y0, y1 = max(0.0, cy - vh / (2 * scale)), min(float(height), cy + vh / (2 * scale))
+    if x1 <= x0 or y1 <= y0:
+        return None
+
+    # Same rectangle in `image` pixels (whole pixels, so nothing is cut off)
+    fx, fy = image.shape[1] / width, image.shape[0] / height
+    lx0, lx1 = int(x0 * fx), min(image.shape[1], math.ceil(x1 * fx))
+    ly0, ly1 = int(y0 * fy), min(image.shape[0], math.ceil(y1 * fy))
+    crop = image[ly0:ly1, lx0:lx1]
+
+    # Where that crop lands on screen
+    left = (lx0 / fx - cx) * scale + vw / 2
+    top = (ly0 / fy - cy) * scale + vh / 2
+    size = (max(1, round((lx1 - lx0) / fx * scale)), max(1, round((ly1 - ly0) / fy * scale)))
+
+    if (crop.shape[1], crop.shape[0]) != size:
+        # Magnified: nearest neighbour keeps single pixels sharp squares
+        interp = cv2.INTER_AREA if size[0] < crop.shape[1] else cv2.INTER_NEAREST
+        crop = cv2.resize(crop, size, interpolation=interp)
+    return to_rgb(crop), (round(left), round(top))
+
+
+class DisplayCache:
+    """
+    Pyramid of the processor's current image, keyed by image version.
+
+    Level n is the image at 1/2**n of its full resolution. Levels are built
+    on first use (through ImageProcessor.render_parts, i.e. on the proxy), and all
+    of them are forgotten when the image version changes.
+
+    Usage:
+        cache = DisplayCache(processor)
+        rgb, (x, y) = cache.view(scale, center, (vw, vh))
+    """
+
+    def __init__(self, processor, max_w: int = 900, max_h: int = 650) -> None:
+        self._processor = processor
+        # Default viewport (before the window is laid out) and preview size
+        self.max_w = max_w
+        self.max_h = max_h
+        self._version: Optional[int] = None
+        self._levels: Dict[int, np.ndarray] = {}
+
+    def clear(self) -> None:
+        self._version = None
+        self._levels = {}
+
+    def _level(self, level: int, width: int, height: int):
+        if level not in self._levels:
+            self._levels[level] = self._render_level(level, width, height)
+        return self._levels[level]
+
+    @traced("display.level", "display")
+    def _render_level(self, level: int, width: int, height: int):
+        size = (max(1, -(-width >> level)), max(1, -(-height >> level)))  # ceil
+        pixels, (flipped, turns) = self._processor.render_parts(*size)
+        return orientation_view(pixels, flipped, turns)
+
+    def level_for(self, scale: float) -> int:
+        """Coarsest pyramid level that is still at least as fine as `scale`."""
+        width, height = self._processor.get_dimensions()
+        level = 0
+        while 2 ** (level + 1) * scale <= 1.0 and min(width, height) >> (level + 1) >= 1:
+            level += 1
+        return level
+
+    def view(self, scale: float, center: Tuple[float, float], viewport: Tuple[int, int],
+             min_level: int = 0):
+        """
+        Visible part of the current image (see crop_view()), cut from the
+        coarsest pyramid level that is still at least as fine as the screen.
+        min_level=1 never touches the full-resolution level (e.g. while it is
+        being rendered elsewhere); the view is then magnified from level 1.
+        """
+        state = self._processor.snapshot()
+        if state.version != self._version:
+            self.clear()
+            self._version = state.version
+
+        width, height = self._processor.get_dimensions()
+        level = self.level_for(scale)
+        if level < min_level and min(width, height) >> min_level >= 1:
+            level = min_level
+        return crop_view(self._level(level, width, height), (width, height), scale, center, viewport)
+
+    @property
+    def nbytes(self) -> int:
+        """Memory held by the cached levels (level 0 shares the image's own pixels)."""
+        return sum(level.nbytes for n, level in self._levels.items() if n > 0)
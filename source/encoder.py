@@ -0,0 +1,105 @@
+"""
+Image encoding presets and atomic file writes.
+
+Why this module exists:
+- cv2.imwrite() writes straight over the target: a crash (or a full disk)
+  in the middle leaves a corrupt file where the user's image used to be.
+  write_atomic() writes a temporary file next to the target and renames it
+  into place, so the target is always either the old or the new image.
+- encoding is where a save spends its time (PNG compression above all);
+  presets let the user trade encode time against file size.
+"""
+
+from __future__ import annotations
+
+import os
+import stat
+import tempfile
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+import cv2
+
+
+class EncoderPreset(NamedTuple):
+    """Encoder settings for the formats that have any."""
+
+    label: str
+    png_compression: int = 3      # 0 (fastest, biggest) - 9 (slowest, smallest)
+    jpeg_quality: int = 95        # 0 - 100
+    jpeg_progressive: bool = False
+    jpeg_optimize: bool = False   # optimized Huffman tables: smaller, a bit slower
+
+
+PRESETS: Dict[str, EncoderPreset] = {
+    "fast": EncoderPreset("Fast (bigger files)", png_compression=1, jpeg_quality=90),
+    "balanced": EncoderPreset("Balanced", png_compression=3, jpeg_quality=95),
+    "small": EncoderPreset("Small files (slower)", png_compression=9, jpeg_quality=90,
+                           jpeg_progressive=True, jpeg_optimize=True),
+    "max_quality": EncoderPreset("Maximum quality", png_compression=6, jpeg_quality=100,
+                                 jpeg_optimize=True),
+}
+
+DEFAULT_PRESET = "balanced"
+
+
+def imwrite_params(filepath: str, preset: Optional[EncoderPreset] = None) -> List[int]:
+    """cv2 encoder flags for `filepath`'s format (empty for formats without any)."""
+    preset = preset or PRESETS[DEFAULT_PRESET]
+    ext = os.path.splitext(filepath)[1].lower()
+    if ext == ".png":
+        return [cv2.IMWRITE_PNG_COMPRESSION, int(preset.png_compression)]
+    if ext in (".jpg", ".jpeg"):
+        return [cv2.IMWRITE_JPEG_QUALITY, int(preset.jpeg_quality),
+                cv2.IMWRITE_JPEG_PROGRESSIVE, int(preset.jpeg_progressive),
+                cv2.IMWRITE_JPEG_OPTIMIZE, int(preset.jpeg_optimize)]
+    return []
+
+
+# The process umask, read once at import (os.umask can only be read by
+# setting it, which is not safe once save threads run)
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+
+def _target_mode(filepath: str) -> int:
+    """Permission bits of `filepath`, or those of a new file (0o666 minus the umask)."""
+    try:
+        return stat.S_IMODE(os.stat(filepath).st_mode)
+    except FileNotFoundError:
+        return 0o666 & ~_UMASK
+
+
+def write_atomic(filepath: str, image, preset: Optional[EncoderPreset] = None,
+                 progress: Optional[Callable[[str], None]] = None) -> None:
+    """
+    Encodes `image` and replaces `filepath` with it in one rename.
+
+    Args:
+        progress: optional callback, called with "encoding" / "writing"
+    """
+    ext = os.path.splitext(filepath)[1] or ".png"
+    if progress:
+        progress("encoding")
+    ok, data = cv2.imencode(ext, image, imwrite_params(filepath, preset))
+    if not ok:
+        raise ValueError("Could not save image to the selected path.")
+
+    if progress:
+        progress("writing")
+    folder = os.path.dirname(os.path.abspath(filepath))
+    fd, tmp = tempfile.mkstemp(dir=folder, prefix="." + os.path.basename(filepath) + ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data.tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        # mkstemp creates the file owner-only: give it the permissions the
+        # target has (or a new file would get) before it takes its place
+        os.chmod(tmp, _target_mode(filepath))
+        os.replace(tmp, filepath)  # atomic on the same file system
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
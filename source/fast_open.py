@@ -0,0 +1,119 @@
+"""
+Fast open for large JPEGs: show a reduced decode now, decode in full later.
+
+Why:
+- a full cv2.imread of a 50 MP JPEG takes seconds, but the first thing on
+  screen is a window-sized picture.
+- JPEG can be decoded at 1/2, 1/4 or 1/8 size directly (DCT scaling,
+  cv2.IMREAD_REDUCED_COLOR_*), which skips most of the work. That copy is
+  shown and edited (as a proxy) at once, while the full decode runs on a
+  background thread and is swapped in when ready (op_graph.PendingSource).
+"""
+
+from __future__ import annotations
+
+from concurrent.futures import Executor
+from typing import Optional, Tuple
+
+import cv2
+
+from op_graph import PendingSource
+
+
+JPEG_EXTENSIONS = (".jpg", ".jpeg")
+
+# (size divisor, imread flag, grayscale imread flag, pyramid level),
+# largest reduction first
+REDUCED_MODES = (
+    (8, cv2.IMREAD_REDUCED_COLOR_8, cv2.IMREAD_REDUCED_GRAYSCALE_8, 3),
+    (4, cv2.IMREAD_REDUCED_COLOR_4, cv2.IMREAD_REDUCED_GRAYSCALE_4, 2),
+    (2, cv2.IMREAD_REDUCED_COLOR_2, cv2.IMREAD_REDUCED_GRAYSCALE_2, 1),
+)
+
+# JPEG markers that carry the frame size (SOF0 - SOF15 except DHT/JPG/DAC)
+_SOF_MARKERS = set(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+
+
+def jpeg_size(filepath: str) -> Optional[Tuple[int, int]]:
+    """
+    (width, height) from a JPEG header, without decoding any pixels.
+    Returns None if the file is not a JPEG (or the header is damaged).
+    """
+    header = jpeg_header(filepath)
+    return None if header is None else header[:2]
+
+
+def jpeg_header(filepath: str) -> Optional[Tuple[int, int, int]]:
+    """(width, height, number of colour components) from a JPEG header, or None."""
+    with open(filepath, "rb") as f:
+        if f.read(2) != b"\xff\xd8":
+            return None
+        while True:
+            byte = f.read(1)
+            while byte and byte != b"\xff":
+                byte = f.read(1)
+            while byte == b"\xff":  # fill bytes
+                byte = f.read(1)
+            if not byte:
+                return None
+            marker = byte[0]
+            if marker == 0x01 or 0xD0 <= marker <= 0xD8:
+                continue  # markers without a length
+            if marker in (0xD9, 0xDA):
+                return None  # end of image / start of scan: no frame header
+            length = int.from_bytes(f.read(2), "big")
+            if marker in _SOF_MARKERS:
+                data = f.read(6)
+                if len(data) < 6:
+                    return None
+                return int.from_bytes(data[3:5], "big"), int.from_bytes(data[1:3], "big"), data[5]
+            f.seek(length - 2, 1)
+
+
+def _ceil_div(a: int, b: int) -> int:
+    return -(-a // b)
+
+
+def open_reduced(filepath: str, max_w: int, max_h: int,
+                 executor: Executor) -> Optional[PendingSource]:
+    """
+    Decodes a JPEG at the smallest reduced size that still fills a
+    max_w x max_h view, and starts the full decode on `executor`.
+
+    Returns None when a fast open does not pay off (not a JPEG, or too
+    small to need a reduction): the caller should do a normal full load.
+    """
+    if not filepath.lower().endswith(JPEG_EXTENSIONS):
+        return None
+    header = jpeg_header(filepath)
+    if header is None:
+        return None
+    width, height, components = header
+    gray = components == 1  # decoded single-channel, like a full load
+    # Fit scale of the larger-looking orientation (EXIF may rotate the image)
+    fit = max(min(max_w / width, max_h / height), min(max_w / height, max_h / width))
+
+    for divisor, color_flag, gray_flag, level in REDUCED_MODES:
+        if 1.0 / divisor < fit:
+            continue  # would look blurry on screen
+        reduced = cv2.imread(filepath, gray_flag if gray else color_flag)
+        if reduced is None:
+            return None
+        # cv2 applies the EXIF orientation: work out if width/height swapped
+        rh, rw = reduced.shape[:2]
+        if (rw, rh) == (_ceil_div(width, divisor), _ceil_div(height, divisor)):
+            shape = (height, width) + reduced.shape[2:]
+        elif (rw, rh) == (_ceil_div(height, divisor), _ceil_div(width, divisor)):
+            shape = (width, height) + reduced.shape[2:]
+        else:
+            return None
+        future = executor.submit(_decode_full, filepath, shape)
+        return PendingSource(shape, reduced, level, future)
+    return None
+
+
+def _decode_full(filepath: str, shape: Tuple[int, ...]):
+    image = cv2.imread(filepath, cv2.IMREAD_ANYCOLOR)
+    if image is None or image.shape != shape:
+        raise ValueError("Could not read image. Please use JPG, PNG, or BMP.")
+    return image
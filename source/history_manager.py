@@ -4,90 +4,489 @@ Manages undo/redo history for image operations
 Demonstrates encapsulation and stack-based operations
 """
 
+import os
+import shutil
+import tempfile
+import weakref
+import zlib
+from collections import deque
+
 import numpy as np
 
+import operations
+from tracing import traced
+
+
+# Default memory budget for all undo/redo states together
+DEFAULT_HISTORY_BYTES = 512 * 1024 * 1024
+
+# Default disk budget for states spilled to memory-mapped files
+DEFAULT_DISK_BYTES = 8 * 1024 * 1024 * 1024
+
+# A full keyframe is stored after this many command-only steps
+DEFAULT_KEYFRAME_INTERVAL = 10
+
+# Rough size of one stored command (name + params)
+COMMAND_BYTES = 128
+
+# A region edit counts towards the keyframe interval by the share of the
+# image it covers (replaying it only touches that part), but at least this
+REGION_MIN_COST = 0.02
+
+
+class _PackedFrame:
+    """
+    A numpy image stored compressed (fast lossless zlib, level 1).
+
+    Why:
+    - a 100 MP RGB frame is 300 MB raw; most edited images compress well,
+      so many more undo steps fit into the same memory budget.
+    """
+
+    __slots__ = ("shape", "dtype", "data", "compressed")
+
+    def __init__(self, image):
+        self.shape = image.shape
+        self.dtype = image.dtype
+        raw = np.ascontiguousarray(image).tobytes()
+        packed = zlib.compress(raw, 1)
+        # Noise-like images barely compress: keep them raw (faster undo)
+        self.compressed = len(packed) < 0.9 * len(raw)
+        self.data = packed if self.compressed else raw
+
+    @property
+    def nbytes(self):
+        return len(self.data)
+
+    def unpack(self):
+        raw = zlib.decompress(self.data) if self.compressed else self.data
+        # frombuffer is read-only; copy so the caller gets its own array
+        return np.frombuffer(raw, dtype=self.dtype).reshape(self.shape).copy()
+
+
+class _SpilledFrame:
+    """
+    A keyframe moved out of RAM into a file in the session directory.
+
+    Why:
+    - restoring maps the file (np.memmap) instead of reading it, so an old
+      state comes back without a copy and the OS pages in only what is used.
+    - RAM stays flat however many steps are kept; only the disk grows.
+    """
+
+    __slots__ = ("path", "shape", "dtype", "disk_bytes", "state")
+
+    def __init__(self, path, image, state=None):
+        self.path = path
+        self.shape = image.shape
+        self.dtype = image.dtype
+        image.tofile(path)  # always written in C order
+        self.disk_bytes = image.nbytes
+        # LazyImage keyframes are kept, rebased onto the mapped file
+        self.state = state(self.map("r")) if state is not None else None
+
+    nbytes = 0  # nothing in RAM
+
+    def map(self, mode):
+        return np.memmap(self.path, dtype=self.dtype, mode=mode, shape=self.shape)
+
+    def unpack(self):
+        if self.state is not None:
+            return self.state.copy()
+        # Copy-on-write mapping: zero-copy, and the caller may still
+        # modify "its" array without touching the file.
+        return self.map("c")
+
+    def drop_caches(self):
+        if self.state is not None:
+            self.state.drop_caches()
+
+    def delete(self):
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass  # still mapped (Windows): removed with the session directory
+
+
+class _Entry:
+    """
+    One history step: the command that led to it (op name + params) and,
+    for keyframes, the full state.
+
+    Why:
+    - a command costs a few bytes; the state it produces can be rebuilt
+      from the nearest keyframe below it, so most steps store no pixels.
+    """
+
+    __slots__ = ("command", "keyframe", "nbytes", "cost")
+
+    def __init__(self, command=None, keyframe=None, cost=1.0):
+        self.command = command    # (name, params) or None
+        self.keyframe = keyframe  # _PackedFrame / LazyImage or None
+        self.cost = cost          # replay work, in full-image ops
+        self.nbytes = 0
+        self.measure()
+
+    def measure(self):
+        """Re-reads the size (a lazy snapshot may have cached pixels since)."""
+        self.nbytes = COMMAND_BYTES if self.command is not None else 0
+        if self.keyframe is not None:
+            self.nbytes += getattr(self.keyframe, "nbytes", 0)
+        return self.nbytes
+
+    def restore(self):
+        if isinstance(self.keyframe, (_PackedFrame, _SpilledFrame)):
+            return self.keyframe.unpack()
+        return self.keyframe.copy()
+
+    def discard(self):
+        """Frees the disk space of a spilled keyframe; returns the bytes freed."""
+        if isinstance(self.keyframe, _SpilledFrame):
+            self.keyframe.delete()
+            return self.keyframe.disk_bytes
+        return 0
+
 
 class HistoryManager:
     """
     HistoryManager class manages the undo/redo history stack.
-    
+
     Demonstrates OOP Concepts:
     - Encapsulation: Private attributes for history stacks
     - Constructor: __init__ method to initialize empty stacks
-    - Methods: push, undo, redo, reset operations
+    - Methods: push, push_command, undo, redo, reset operations
     - Class Interaction: Works with ImageEditorApp to manage state
-    
+
     Uses two stacks:
-    - _undo_stack: Stores previous states for undo operation
-    - _redo_stack: Stores undone states for redo operation
+    - _undo_stack: Stores previous steps for undo operation
+    - _redo_stack: Stores undone steps for redo operation
+
+    Command log:
+    - push() stores a full state (a keyframe), push_command() only the
+      op name + params. Every `keyframe_interval` commands a keyframe is
+      stored as well, so rebuilding a state never replays many ops.
+    - A region edit (op "region") is stored as its rectangle + op, never
+      as pixels of the whole frame; it counts towards the interval by the
+      share of the image it covers, so small region edits rarely add a
+      keyframe and undoing them replays work on their rectangles only.
+    - Undo of an exactly invertible op (90-degree rotation, flip, invert)
+      applies the inverse op to the current state; any other undo replays
+      the commands since the nearest keyframe.
+
+    Memory (two tiers):
+    - RAM is limited by a byte budget (max_bytes), not by a fixed count,
+      so small images get deep undo and huge images never exhaust RAM.
+    - numpy keyframes are stored compressed; LazyImage snapshots are stored
+      as-is (they share pixels) and charged for the pixels they cache.
+    - Over the RAM budget, the oldest keyframes spill to memory-mapped files
+      in a temporary session directory (max_disk_bytes). Only when the disk
+      budget is used up too are the oldest steps dropped.
+    - Spill files are deleted on reset() and when the program exits.
+    - Stacks are deques, so dropping the oldest step is O(1).
     """
-    
-    def __init__(self, max_history=20):
+
+    def __init__(self, max_bytes=DEFAULT_HISTORY_BYTES, max_history=None,
+                 replay=None, keyframe_interval=DEFAULT_KEYFRAME_INTERVAL,
+                 max_disk_bytes=DEFAULT_DISK_BYTES, spill_dir=None):
         """
         Constructor: Initialize the HistoryManager with empty stacks.
-        
+
         Args:
-            max_history: Maximum number of states to keep in history (default: 20)
+            max_bytes: Memory budget for all stored states (default: 512 MB)
+            max_history: Optional hard limit on the number of steps
+                         (default: None = only the byte budget applies)
+            replay: Function replay(state, name, params) -> new state,
+                    needed by push_command() (e.g. op_graph.replay)
+            keyframe_interval: Commands between two stored keyframes
+            max_disk_bytes: Disk budget for spilled states (0 = never spill)
+            spill_dir: Where the session directory is created
+                       (default: the system temp directory)
+        """
+        self._undo_stack = deque()  # Private attribute (encapsulation)
+        self._redo_stack = deque()  # Private attribute (encapsulation)
+        self._max_bytes = max_bytes
+        self._max_history = max_history
+        self._replay = replay
+        self._keyframe_interval = max(1, keyframe_interval)
+        self._current = None  # State of the top step (LazyImage only)
+        self._bytes = 0  # RAM bytes used by both stacks
+        self._max_disk_bytes = max_disk_bytes
+        self._disk_bytes = 0  # Bytes in spill files
+        self._spill_parent = spill_dir
+        self._session_dir = None
+        self._cleanup = None  # weakref.finalize that removes the session directory
+        self._spill_count = 0
+
+    def _pack(self, image):
+        """Wrap a state for storage (numpy frames get compressed)."""
+        if isinstance(image, np.ndarray):
+            return _PackedFrame(image)
+        return image.copy()
+
+    def _remember(self, state):
+        """
+        Keep a reference to the current state, but only if it is immutable
+        (LazyImage): holding a raw numpy frame would defeat compression.
+        """
+        self._current = None if isinstance(state, np.ndarray) else state
+
+    def _retire(self, entry):
+        """
+        A state leaves the screen: drop its display caches (LazyImage)
+        and re-measure it, it may have cached pixels since it was pushed.
+        """
+        if hasattr(entry.keyframe, "drop_caches"):
+            entry.keyframe.drop_caches()
+        old = entry.nbytes
+        self._bytes += entry.measure() - old
+
+    @traced("history.rebuild", "history")
+    def _rebuild(self):
+        """Rebuild the top state: nearest keyframe + replay of the commands above it."""
+        index = len(self._undo_stack) - 1
+        while self._undo_stack[index].keyframe is None:
+            index -= 1
+        state = self._undo_stack[index].restore()
+        for i in range(index + 1, len(self._undo_stack)):
+            name, params = self._undo_stack[i].command
+            state = self._replay(state, name, params)
+        return state
+
+    def _since_keyframe(self):
+        """Replay work (see _Entry.cost) of the commands on top of the nearest keyframe."""
+        count = 0
+        for entry in reversed(self._undo_stack):
+            if entry.keyframe is not None:
+                break
+            count += entry.cost
+        return count
+
+    @staticmethod
+    def _cost(name, params, result):
+        """
+        Replay work of a command, in full-image ops: a region edit only
+        costs the share of the image it covers, so a series of small region
+        edits is stored as commands (no full frame) for longer.
         """
-        self._undo_stack = []  # Private attribute (encapsulation)
-        self._redo_stack = []  # Private attribute (encapsulation)
-        self._max_history = max_history  # Limit to prevent memory issues
-    
+        if name != "region":
+            return 1.0
+        height, width = result.shape[:2]
+        x0, y0, x1, y1 = operations.region_rect(result.shape, *params[:4])
+        return max(REGION_MIN_COST, (x1 - x0) * (y1 - y0) / float(max(1, width * height)))
+
+    def _trim(self):
+        """
+        Fit history into its budgets (keeps current): spill old states to
+        disk first, then drop the oldest steps.
+        """
+        self._spill_over_budget()
+        while len(self._undo_stack) > 1 and (
+                self._bytes > self._max_bytes
+                or (self._max_history is not None and len(self._undo_stack) > self._max_history)):
+            oldest = self._undo_stack.popleft()  # O(1)
+            following = self._undo_stack[0]
+            if following.keyframe is None:
+                # The next step only stores a command: turn it into the
+                # new base keyframe before its base goes away.
+                name, params = following.command
+                state = self._replay(oldest.restore(), name, params)
+                following.keyframe = self._pack(state)
+                self._retire(following)
+            self._discard(oldest)
+
+    def _discard(self, entry):
+        """Forget a step: give back its RAM and disk bytes."""
+        self._bytes -= entry.nbytes
+        self._disk_bytes -= entry.discard()
+
+    def _clear_redo(self):
+        for undone in self._redo_stack:
+            self._discard(undone)
+        self._redo_stack.clear()
+
+    # ---------- Disk tier ----------
+
+    def _spill_path(self):
+        if self._session_dir is None:
+            self._session_dir = tempfile.mkdtemp(prefix="image-editor-history-", dir=self._spill_parent)
+            # Runs on reset() or garbage collection, and at interpreter exit
+            self._cleanup = weakref.finalize(self, shutil.rmtree, self._session_dir, True)
+        self._spill_count += 1
+        return os.path.join(self._session_dir, "state-%06d.raw" % self._spill_count)
+
+    def _spill_candidates(self):
+        """In-RAM keyframes, oldest first (never the state on screen)."""
+        for i in range(len(self._undo_stack) - 1):
+            yield self._undo_stack[i]
+        for entry in self._redo_stack:  # left end = furthest from the current state
+            yield entry
+
+    @traced("history.spill", "history")
+    def _spill(self, entry):
+        """
+        Move one keyframe to disk. Returns False if it holds no pixels of its
+        own or could not be written.
+        """
+        keyframe = entry.keyframe
+        state = None
+        if isinstance(keyframe, _PackedFrame):
+            pixels = keyframe.unpack()
+        elif getattr(keyframe, "is_evaluated", lambda: False)() and keyframe.nbytes:
+            pixels = keyframe.evaluate()
+            state = lambda mapped: keyframe.rebase(pixels, mapped)
+        else:
+            return False
+        if self._disk_bytes + pixels.nbytes > self._max_disk_bytes:
+            return False
+        try:
+            spilled = _SpilledFrame(self._spill_path(), pixels, state)
+        except OSError:
+            return False  # disk full / not writable: fall back to dropping
+
+        entry.keyframe = spilled
+        self._disk_bytes += spilled.disk_bytes
+        if state is not None:
+            # Other snapshots built on the same pixels must use the mapped
+            # copy too, otherwise the RAM buffer stays alive.
+            mapped = spilled.state.evaluate()
+            for other in list(self._undo_stack)[:-1] + list(self._redo_stack):
+                if hasattr(other.keyframe, "rebase"):
+                    other.keyframe = other.keyframe.rebase(pixels, mapped)
+                    old = other.nbytes
+                    self._bytes += other.measure() - old
+        old = entry.nbytes
+        self._bytes += entry.measure() - old
+        return True
+
+    def _spill_over_budget(self):
+        """Spill the oldest keyframes until RAM fits the budget."""
+        if self._bytes <= self._max_bytes or self._max_disk_bytes <= 0:
+            return
+        for entry in self._spill_candidates():
+            if self._bytes <= self._max_bytes:
+                break
+            if entry.keyframe is not None and not isinstance(entry.keyframe, _SpilledFrame):
+                self._spill(entry)
+
+    @traced("history.push", "history")
     def push(self, image):
         """
-        Push a new image state to the history.
+        Push a new image state to the history (stored as a keyframe).
         Clears the redo stack as new action invalidates redo history.
-        
+
         Args:
-            image: Image to add to history (numpy array)
+            image: Image to add to history (numpy array, or a LazyImage
+                   snapshot from ImageProcessor - its copy() is free because
+                   a LazyImage never changes)
         """
         if image is None:
             return
-        
-        # Add current state to undo stack (make a copy to avoid reference issues)
-        self._undo_stack.append(image.copy())
-        
-        # Limit stack size to prevent memory overflow
-        if len(self._undo_stack) > self._max_history:
-            self._undo_stack.pop(0)  # Remove oldest entry
-        
+
+        if self._undo_stack:
+            self._retire(self._undo_stack[-1])
+
+        entry = _Entry(keyframe=self._pack(image))
+        self._undo_stack.append(entry)
+        self._bytes += entry.nbytes
+        self._remember(image)
+
         # Clear redo stack when new action is performed
-        self._redo_stack.clear()
-    
+        self._clear_redo()
+
+        # Limit memory use (oldest steps go first)
+        self._trim()
+
+    @traced("history.push_command", "history")
+    def push_command(self, name, params=(), result=None):
+        """
+        Push an operation instead of a full image state.
+
+        Args:
+            name: Operation name (e.g. "rotate")
+            params: Operation parameters (e.g. (90,))
+            result: The state the operation produced, if the caller already
+                    has it (saves one replay)
+        """
+        if self._replay is None:
+            raise ValueError("push_command() needs a replay function.")
+        if not self._undo_stack:
+            raise ValueError("push_command() needs a base state: call push() first.")
+
+        params = tuple(params)
+        if result is None:
+            base = self._current if self._current is not None else self._rebuild()
+            result = self._replay(base, name, params)
+
+        self._retire(self._undo_stack[-1])
+        cost = self._cost(name, params, result)
+        keyframe = None
+        if self._since_keyframe() + cost >= self._keyframe_interval:
+            keyframe = self._pack(result)
+
+        entry = _Entry(command=(name, params), keyframe=keyframe, cost=cost)
+        self._undo_stack.append(entry)
+        self._bytes += entry.nbytes
+        self._remember(result)
+
+        self._clear_redo()
+        self._trim()
+
+    @traced("history.undo", "history")
     def undo(self):
         """
         Undo the last operation by returning the previous state.
-        
+
         Returns:
             Previous image state or None if no undo available
         """
-        # Need at least 2 states to undo (current + previous)
+        # Need at least 2 steps to undo (current + previous)
         if len(self._undo_stack) < 2:
             return None
-        
-        # Pop current state and move to redo stack
+
+        # Pop current step and move to redo stack
         current = self._undo_stack.pop()
+        self._retire(current)
         self._redo_stack.append(current)
-        
-        # Return previous state (but keep it in undo stack)
-        return self._undo_stack[-1].copy()
-    
+
+        inverse = None
+        if current.command is not None and self._current is not None:
+            inverse = operations.inverse(*current.command)
+
+        if inverse is not None:
+            # Lossless op: undoing it is just another op, no replay needed
+            state = self._replay(self._current, *inverse)
+        elif self._undo_stack[-1].keyframe is not None:
+            state = self._undo_stack[-1].restore()
+        else:
+            state = self._rebuild()
+        self._remember(state)
+        return state
+
+    @traced("history.redo", "history")
     def redo(self):
         """
         Redo the last undone operation.
-        
+
         Returns:
             Next image state or None if no redo available
         """
         if len(self._redo_stack) == 0:
             return None
-        
+
         # Pop from redo stack and move back to undo stack
-        next_state = self._redo_stack.pop()
-        self._undo_stack.append(next_state)
-        
-        return next_state.copy()
-    
+        self._retire(self._undo_stack[-1])
+        next_step = self._redo_stack.pop()
+        self._undo_stack.append(next_step)
+
+        if next_step.keyframe is not None:
+            state = next_step.restore()
+        elif self._current is not None:
+            state = self._replay(self._current, *next_step.command)
+        else:
+            state = self._rebuild()
+        self._remember(state)
+        return state
+
     def reset(self):
         """
         Clear all history (both undo and redo stacks).
@@ -95,30 +494,56 @@ class HistoryManager:
         """
         self._undo_stack.clear()
         self._redo_stack.clear()
-    
+        self._current = None
+        self._bytes = 0
+        # Delete the spill files
+        if self._cleanup is not None:
+            self._cleanup()
+            self._cleanup = None
+        self._session_dir = None
+        self._disk_bytes = 0
+
     def can_undo(self):
         """
         Check if undo operation is available.
-        
+
         Returns:
             True if undo is possible, False otherwise
         """
         return len(self._undo_stack) >= 2
-    
+
     def can_redo(self):
         """
         Check if redo operation is available.
-        
+
         Returns:
             True if redo is possible, False otherwise
         """
         return len(self._redo_stack) > 0
-    
+
     def get_history_size(self):
         """
-        Get the current size of history stacks.
-        
+        Get the current size of history stacks (in steps).
+
         Returns:
             Tuple of (undo_count, redo_count)
         """
-        return (len(self._undo_stack), len(self._redo_stack))
\ No newline at end of file
+        return (len(self._undo_stack), len(self._redo_stack))
+
+    def get_memory_usage(self):
+        """
+        Get the memory used by history.
+
+        Returns:
+            Tuple of (bytes_used, byte_budget)
+        """
+        return (self._bytes, self._max_bytes)
+
+    def get_disk_usage(self):
+        """
+        Get the disk space used by spilled states.
+
+        Returns:
+            Tuple of (bytes_used, byte_budget)
+        """
+        return (self._disk_bytes, self._max_disk_bytes)
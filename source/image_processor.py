@@ -13,13 +13,37 @@ Assignment required filters (all included here):
 6) Rotation (90/180/270)
 7) Flip (horizontal/vertical)
 8) Resize/Scale
+
+Brightness, contrast and the extra tone adjustments (gamma, levels,
+invert, curves) run through the lookup-table engine in pointwise.py.
+
+Edits can also be recorded lazily with record(): they are kept in a
+LazyImage (op_graph.py) and only run, fused, when pixels are needed.
+Recorded edits and previews go through a ResultCache (result_cache.py):
+the same edit on the same pixels returns the state computed before.
+
+region() (or record("region", x, y, w, h, name, params)) applies blur,
+edges, grayscale or a pointwise op to a rectangle only; the cost follows
+the rectangle, not the image.
+
+For very large images enable_tiling() runs blur, edges, grayscale and the
+pointwise ops tile by tile on a thread pool (tiling.py).
 """
 
 from __future__ import annotations
 
-from typing import Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, Optional, Tuple
 import cv2
 
+import encoder
+import operations
+import pointwise
+from op_graph import LazyImage, Op
+from result_cache import CacheStats, ResultCache
+from tracing import traced
+from tiling import TiledExecutor
+
 
 class BaseProcessor:
     """
@@ -28,17 +52,38 @@ class BaseProcessor:
     Why this class exists:
     - Encapsulation: store image and file path inside the object.
     - Reuse: child classes can reuse helper methods like _require_image().
+
+    The image is stored as a LazyImage: pixels + edits not yet run.
+    Reading _image_bgr runs those edits first, so filters always see
+    up-to-date pixels.
+
+    Copy-on-write:
+    - a LazyImage never changes, so the processor, HistoryManager and the
+      app share the same frame (and its read-only pixels) without copying.
+    - whoever wants to modify pixels copies them first; an edit therefore
+      allocates only the one buffer it writes its result into.
     """
 
     def __init__(self) -> None:
-        self._image_bgr: Optional["cv2.MatLike"] = None
+        self._state: Optional[LazyImage] = None
         self._filepath: Optional[str] = None
+        self._tiler: Optional[TiledExecutor] = None
+        self._decoder: Optional[ThreadPoolExecutor] = None
+
+    @property
+    def _image_bgr(self):
+        """Current pixels (read-only). Runs any recorded edits first."""
+        return None if self._state is None else self._state.evaluate(self._tiler)
+
+    @_image_bgr.setter
+    def _image_bgr(self, image_bgr) -> None:
+        self._state = None if image_bgr is None else LazyImage(image_bgr)
 
     # ---------- Encapsulation helpers ----------
 
     def has_image(self) -> bool:
-        """Returns True if an image is currently loaded."""
-        return self._image_bgr is not None
+        """Returns True if an image is currently loaded (never runs edits)."""
+        return self._state is not None
 
     def _require_image(self) -> None:
         """
@@ -46,35 +91,49 @@ class BaseProcessor:
         - If user clicks a filter without opening an image, OpenCV would crash.
         - We raise a clear error so GUI can show a friendly message box.
         """
-        if self._image_bgr is None:
+        if self._state is None:
             raise ValueError("No image loaded. Please open an image first.")
 
     def get_image(self):
         """
-        Returns a COPY of the image (or None).
-        Why copy:
-        - prevents other code from modifying our internal image accidentally.
+        Returns the image as a READ-ONLY array (or None), without copying.
+        Why read-only:
+        - other code cannot modify our internal image accidentally;
+          call .copy() first to get pixels you may change.
         """
-        return None if self._image_bgr is None else self._image_bgr.copy()
+        return self._image_bgr
 
     def set_image(self, image_bgr) -> None:
         """
-        Stores a new image (copy).
+        Stores a new image.
         Supports undo/redo: app can restore older images safely.
+        A LazyImage (from snapshot()) or a read-only array is stored as-is,
+        neither can change. A writable array is copied, because the caller
+        could still modify it.
         """
         if image_bgr is None:
-            self._image_bgr = None
+            self._state = None
             return
-        self._image_bgr = image_bgr.copy()
+        if isinstance(image_bgr, LazyImage):
+            self._state = image_bgr
+            return
+        self._image_bgr = image_bgr if not image_bgr.flags.writeable else image_bgr.copy()
+
+    def snapshot(self) -> Optional[LazyImage]:
+        """
+        Returns the current state without running or copying anything.
+        Used by the app to store history entries cheaply.
+        """
+        return self._state
 
     def get_filepath(self) -> Optional[str]:
         """Returns the path of the last loaded image (or None)."""
         return self._filepath
 
     def get_dimensions(self) -> Tuple[int, int]:
-        """Returns (width, height)."""
+        """Returns (width, height) (worked out without running edits)."""
         self._require_image()
-        h, w = self._image_bgr.shape[:2]
+        h, w = self._state.shape[:2]
         return w, h
 
 
@@ -86,9 +145,39 @@ class ImageProcessor(BaseProcessor):
 
     def __init__(self) -> None:
         super().__init__()
+        self._results = ResultCache()
+
+    # ---------- Tiled mode ----------
+
+    def enable_tiling(self, tile_size: int = 1024, workers: Optional[int] = None) -> None:
+        """
+        Process large images in tile_size x tile_size tiles on `workers` threads.
+
+        Why:
+        - filters on huge scans otherwise need several full-size buffers at once;
+          tiles keep the extra memory to a few tiles and use all CPU cores.
+        - small images (fewer than ~2 tiles) still run in one call.
+        """
+        self.disable_tiling()
+        self._tiler = TiledExecutor(tile_size, workers)
+
+    def disable_tiling(self) -> None:
+        """Back to whole-image processing."""
+        if self._tiler is not None:
+            self._tiler.close()
+            self._tiler = None
+
+    def _run(self, name: str, *params):
+        """Runs one op on the current pixels (tiled when enabled and worthwhile)."""
+        self._require_image()
+        image = self._image_bgr
+        if self._tiler is not None and self._tiler.should_tile(image) and self._tiler.supports(name):
+            return self._tiler.run(image, name, params)
+        return operations.run(image, name, params)
 
     # ---------- Loading / Saving ----------
 
+    @traced("processor.load", "processor")
     def load(self, filepath: str):
         """
         Loads an image from disk.
@@ -96,86 +185,262 @@ class ImageProcessor(BaseProcessor):
         Why cv2.imread:
         - supports common formats (JPG, PNG, BMP) required by assignment.
         """
-        img = cv2.imread(filepath)
+        # ANYCOLOR: grayscale files stay single-channel (colour ones are BGR)
+        img = cv2.imread(filepath, cv2.IMREAD_ANYCOLOR)
         if img is None:
             raise ValueError("Could not read image. Please use JPG, PNG, or BMP.")
         self._image_bgr = img
         self._filepath = filepath
+        self._results.clear()  # results of the previous image are no use now
         return self.get_image()
 
-    def save(self, filepath: str) -> None:
+    @traced("processor.load_fast", "processor")
+    def load_fast(self, filepath: str, max_w: int = 900, max_h: int = 650) -> bool:
+        """
+        Opens an image for a max_w x max_h view as fast as possible.
+
+        Why:
+        - a big JPEG is decoded at reduced size first (fast_open.py), so it
+          can be shown and edited at once; the full decode continues on a
+          background thread and replaces it transparently. Anything that
+          needs full-resolution pixels (save, eager filters) waits for it.
+
+        Returns True if the full decode is still running (see is_loading()),
+        False if the image was loaded completely (same as load()).
+        """
+        import fast_open  # only the GUI needs it
+
+        if self._decoder is None:
+            self._decoder = ThreadPoolExecutor(max_workers=1, thread_name_prefix="decode")
+        pending = fast_open.open_reduced(filepath, max_w, max_h, self._decoder)
+        if pending is None:
+            self.load(filepath)
+            return False
+        self._state = LazyImage(pending)
+        self._filepath = filepath
+        self._results.clear()
+        return True
+
+    def is_loading(self) -> bool:
+        """True while load_fast() is still decoding the full-resolution image."""
+        return self._state is not None and self._state.is_pending()
+
+    def load_error(self) -> Optional[BaseException]:
+        """The exception the background decode of load_fast() failed with, if it did."""
+        return self._state.load_error() if self._state is not None else None
+
+    @traced("processor.save", "processor")
+    def save(self, filepath: str, preset: Optional[encoder.EncoderPreset] = None) -> None:
         """
         Saves the current image to a file.
         This is optional for GUI, but shows strong OOP design.
+
+        Why write_atomic:
+        - the file is written under a temporary name and renamed into place,
+          so a crash mid-save never leaves a half-written image behind.
         """
         self._require_image()
-        ok = cv2.imwrite(filepath, self._image_bgr)
-        if not ok:
-            raise ValueError("Could not save image to the selected path.")
+        encoder.write_atomic(filepath, self._image_bgr, preset)
+
+    def save_job(self, filepath: str,
+                 preset: Optional[encoder.EncoderPreset] = None) -> Callable:
+        """
+        Returns job(progress) that saves the CURRENT image when called,
+        e.g. later on a background thread. Edits made meanwhile are not
+        included (the job keeps the immutable snapshot taken now).
+        """
+        self._require_image()
+        state, tiler = self._state, self._tiler
+
+        def job(progress=None) -> None:
+            if progress:
+                progress("rendering")
+            encoder.write_atomic(filepath, state.evaluate(tiler), preset, progress)
+
+        return job
+
+    # ---------- Lazy editing ----------
+
+    @traced("processor.record", "processor")
+    def record(self, name: str, *params) -> None:
+        """
+        Records an edit (e.g. record("blur", 5)) WITHOUT running it.
+
+        Why:
+        - the edit runs only when pixels are needed (display, save, export),
+          and a burst of edits is fused into one optimised evaluation.
+        """
+        self._require_image()
+        self._check(name, params)
+        self._state = self._results.then(self._state, Op(name, tuple(params)))
+
+    def replay(self, state: LazyImage, name: str, params: Tuple = ()) -> LazyImage:
+        """
+        Records op `name` on any snapshot, through the result cache
+        (HistoryManager's replay function: an undo that rebuilds a state
+        gets back the very states the edits produced the first time).
+        """
+        return self._results.then(state, Op(name, tuple(params)))
+
+    def cache_stats(self) -> CacheStats:
+        """Hits / misses / evictions of the result cache."""
+        return self._results.stats()
+
+    def clear_cache(self) -> None:
+        self._results.clear()
+
+    @traced("processor.evaluate", "processor")
+    def evaluate(self):
+        """
+        Runs any recorded edits now and returns the read-only result.
+        Same as get_image(), but raises if no image is loaded.
+        """
+        self._require_image()
+        return self._image_bgr
+
+    @traced("processor.render", "processor")
+    def render(self, max_w: int, max_h: int):
+        """
+        Returns display pixels fitted inside max_w x max_h.
+        A resize at the end of the edit chain is folded into this one resample,
+        and the edits run on a downscaled proxy (full resolution only on save).
+        """
+        self._require_image()
+        return self._state.preview(max_w, max_h, self._tiler)
+
+    def render_parts(self, max_w: int, max_h: int):
+        """
+        render() as (pixels, (flipped, turns)), with a rotation / flip at the
+        end of the edit chain not applied yet (see LazyImage.preview_parts).
+        """
+        self._require_image()
+        return self._state.preview_parts(max_w, max_h, self._tiler)
+
+    @traced("processor.preview", "processor")
+    def preview(self, max_w: int, max_h: int, name: str, *params):
+        """
+        Display pixels as if edit `name` had been applied - nothing is recorded.
+        Runs on the small proxy, so it is cheap enough for interactive use.
+        """
+        self._require_image()
+        self._check(name, params)
+        state = self._results.then(self._state, Op(name, tuple(params)))
+        return state.preview(max_w, max_h, self._tiler)
+
+    @staticmethod
+    def _check(name: str, params) -> None:
+        """Rejects an edit before it is recorded (it would only fail when drawn)."""
+        if not operations.is_known(name):
+            raise ValueError(f"Unknown operation: {name}")
+        if name == "region" and (len(params) != 6 or params[4] not in operations.REGION_OPS):
+            raise ValueError("region needs (x, y, w, h, op, params) with op one of "
+                             + ", ".join(operations.REGION_OPS))
 
     # ---------- Required Filters ----------
 
+    @traced("processor.grayscale", "processor")
     def grayscale(self):
-        """Converts the image to grayscale (then back to BGR for consistent display)."""
-        self._require_image()
-        gray = cv2.cvtColor(self._image_bgr, cv2.COLOR_BGR2GRAY)
-        return cv2.cvtColor(gray, cv2.COLOR_GRAY2BGR)
+        """
+        Converts the image to grayscale, kept as ONE channel (a third of the
+        memory and work of BGR); it only becomes RGB when drawn.
+        """
+        return self._run("grayscale")
 
+    @traced("processor.blur", "processor")
     def blur(self, intensity):
         """
         Applies Gaussian blur with adjustable intensity.
         OpenCV requires odd kernel width/height, so we force odd.
+        Big kernels switch to box-filter / pyramid approximations that stay
+        close to a true Gaussian but cost the same at any size (blur_engine.py).
         """
-        self._require_image()
-        k = max(1, int(intensity))
-        if k % 2 == 0:
-            k += 1
-        return cv2.GaussianBlur(self._image_bgr, (k, k), 0)
+        return self._run("blur", intensity)
 
-    def edges(self):
-        """Canny edge detection (uses grayscale internally)."""
-        self._require_image()
-        gray = cv2.cvtColor(self._image_bgr, cv2.COLOR_BGR2GRAY)
-        edge = cv2.Canny(gray, 50, 150)
-        return cv2.cvtColor(edge, cv2.COLOR_GRAY2BGR)
+    @traced("processor.edges", "processor")
+    def edges(self, t1=50, t2=150):
+        """
+        Canny edge detection with thresholds t1/t2 (uses grayscale internally).
+        The result is a single-channel 0/255 map. Calling it again with other thresholds reuses the cached gradients
+        of the current pixels (see canny.py), so exploring thresholds is cheap.
+        """
+        return self._run("edges", t1, t2)
 
+    @traced("processor.brightness", "processor")
     def brightness(self, beta):
-        """Brightness adjustment using beta."""
-        self._require_image()
-        return cv2.convertScaleAbs(self._image_bgr, alpha=1.0, beta=int(beta))
+        """Brightness adjustment using beta (one LUT pass)."""
+        return self.pointwise(pointwise.brightness(beta))
 
+    @traced("processor.contrast", "processor")
     def contrast(self, alpha):
         """Contrast adjustment using alpha (clamped to avoid unusable images)."""
-        self._require_image()
-        alpha_f = max(0.1, min(float(alpha), 3.0))
-        return cv2.convertScaleAbs(self._image_bgr, alpha=alpha_f, beta=0)
+        return self.pointwise(pointwise.contrast(alpha))
 
+    @traced("processor.rotate", "processor")
     def rotate(self, angle: int):
         """Rotate image by 90, 180, or 270 degrees."""
         self._require_image()
-        if angle == 90:
-            return cv2.rotate(self._image_bgr, cv2.ROTATE_90_CLOCKWISE)
-        if angle == 180:
-            return cv2.rotate(self._image_bgr, cv2.ROTATE_180)
-        if angle == 270:
-            return cv2.rotate(self._image_bgr, cv2.ROTATE_90_COUNTERCLOCKWISE)
-        return self._image_bgr.copy()
+        return operations.rotate(self._image_bgr, angle)
 
+    @traced("processor.flip", "processor")
     def flip(self, mode: str):
         """Flip image horizontally ('h') or vertically ('v')."""
         self._require_image()
-        if mode == "h":
-            return cv2.flip(self._image_bgr, 1)
-        if mode == "v":
-            return cv2.flip(self._image_bgr, 0)
-        return self._image_bgr.copy()
-
-    def resize(self, scale):
-        """Resize/scale image with clamped scale value."""
+        return operations.flip(self._image_bgr, mode)
+
+    @traced("processor.resize", "processor")
+    def resize(self, scale, quality=operations.DEFAULT_RESIZE_QUALITY):
+        """
+        Resize/scale image with clamped scale value.
+        quality: "nearest", "linear", "pyramid", "area" or "lanczos"
+        (operations.RESIZE_QUALITIES). A recorded resize (record("resize", ...))
+        is combined with earlier ones and resampled once from the unscaled image.
+        """
         self._require_image()
-        scale_f = max(0.1, min(float(scale), 5.0))
+        return operations.resize(self._image_bgr, operations.clamp_scale(scale), quality)
 
-        h, w = self._image_bgr.shape[:2]
-        new_w = max(1, int(w * scale_f))
-        new_h = max(1, int(h * scale_f))
-        return cv2.resize(self._image_bgr, (new_w, new_h), interpolation=cv2.INTER_AREA)
+    # ---------- Regions ----------
+
+    @traced("processor.region", "processor")
+    def region(self, rect: Tuple[int, int, int, int], name: str, *params):
+        """
+        Applies op `name` (blur, edges, grayscale or a pointwise op) to the
+        rectangle rect = (x, y, w, h) only; the rest of the image is kept.
+        The op runs on a view of the rectangle plus the margin it needs,
+        so its cost follows the rectangle size (operations.region).
+        """
+        self._require_image()
+        self._check("region", tuple(rect) + (name, params))
+        return operations.region(self._image_bgr, *rect, name, params)
+
+    # ---------- Pointwise Adjustments (lookup tables) ----------
+
+    @traced("processor.pointwise", "processor")
+    def pointwise(self, *ops: pointwise.PointwiseOp):
+        """
+        Applies one or more pointwise ops in order.
+
+        Why one method for all of them:
+        - the ops are folded into a single 256-entry table first,
+          so e.g. brightness + contrast + gamma is still ONE pass over the image.
+        """
+        self._require_image()
+        image = self._image_bgr
+        if ops and self._tiler is not None and self._tiler.should_tile(image):
+            return self._tiler.lut(image, pointwise.compose(ops))
+        return pointwise.apply(image, ops)
+
+    def gamma(self, value):
+        """Gamma correction (value > 1 brightens mid-tones)."""
+        return self.pointwise(pointwise.gamma(value))
+
+    def levels(self, in_black=0, in_white=255, mid_gamma=1.0, out_black=0, out_white=255):
+        """Levels adjustment (input range, mid-tone gamma, output range)."""
+        return self.pointwise(pointwise.levels(in_black, in_white, mid_gamma, out_black, out_white))
+
+    def invert(self):
+        """Inverts the image (negative)."""
+        return self.pointwise(pointwise.invert())
+
+    def curves(self, points: Iterable[Tuple[int, int]]):
+        """Tone curve through (input, output) control points."""
+        return self.pointwise(pointwise.curves(points))
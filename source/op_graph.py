@@ -0,0 +1,604 @@
+"""
+Lazy operation graph.
+
+Instead of running every edit at full resolution the moment it is clicked,
+ImageProcessor records the edit (op name + parameters) in a LazyImage.
+Pixels are only computed when something really needs them
+(display, save, export).
+
+When the graph runs, compatible steps are fused first:
+- pointwise ops (brightness, contrast, gamma, ...) -> ONE lookup table pass
+- rotations / flips -> ONE combined orientation (at most two cv2 calls).
+  They are even collapsed while recording: rotating four times leaves no
+  op at all, and the display applies a trailing orientation to what it
+  draws only (see preview_parts() / orientation_view()).
+- consecutive resizes -> ONE resample. While recording, resizes (and
+  rotations / flips) after the last pixel-changing op are kept as ONE
+  resize from that state: 50 % then 200 % is no resize at all, never two
+  lossy passes (see then()).
+- a resize at the end of the chain is folded into the display resample
+- a region edit ("region" op) writes into the buffer the step before it
+  produced, when that buffer is a scratch one; only the source is copied
+"""
+
+from __future__ import annotations
+
+import itertools
+import math
+from typing import List, NamedTuple, Optional, Tuple
+
+import cv2
+import numpy as np
+
+import operations
+import pointwise
+from tracing import TRACER
+
+
+class Op(NamedTuple):
+    """One recorded edit: op name + parameter tuple."""
+
+    name: str
+    params: Tuple = ()
+
+
+class Step(NamedTuple):
+    """One executable step of a fused plan."""
+
+    kind: str  # "lut", "orient", "resize" or "op"
+    args: Tuple
+
+
+# ---------- Orientation algebra ----------
+# Any mix of 90-degree rotations and flips is one of 8 orientations.
+# We store it as (flipped, turns): first flip horizontally if `flipped`,
+# then rotate clockwise `turns` x 90 degrees.
+
+def _compose_orientation(state: Tuple[int, int], op: Op) -> Tuple[int, int]:
+    flipped, turns = state
+    if op.name == "rotate":
+        angle = op.params[0] if op.params else 0
+        if angle in (90, 180, 270):
+            turns = (turns + angle // 90) % 4
+        return flipped, turns
+    mode = op.params[0] if op.params else ""
+    if mode == "h":
+        # H . R(k) = R(-k) . H
+        return flipped ^ 1, (-turns) % 4
+    if mode == "v":
+        # V = R(2) . H
+        return flipped ^ 1, (2 - turns) % 4
+    return flipped, turns
+
+
+def orientation_ops(flipped: int, turns: int) -> Tuple[Op, ...]:
+    """The shortest op list for an orientation: [flip h] [rotate] (empty if none)."""
+    ops: Tuple[Op, ...] = ()
+    if flipped:
+        ops += (Op("flip", ("h",)),)
+    if turns:
+        ops += (Op("rotate", (90 * turns,)),)
+    return ops
+
+
+def split_orientation(ops, geometry=operations.ORIENTATION_OPS) -> Tuple[int, Tuple[int, int]]:
+    """
+    Splits off the ops at the end of `ops` whose names are in `geometry`.
+    Returns (where they start, their combined orientation).
+    """
+    n, _, _, state = split_geometry(ops, geometry)
+    return n, state
+
+
+def split_geometry(ops, geometry=operations.GEOMETRY_OPS):
+    """
+    Splits off the ops at the end of `ops` whose names are in `geometry`.
+    Returns (where they start, combined scale, quality of the last resize,
+    combined orientation). A resize commutes with rotations and flips, so
+    the order between them does not matter.
+    """
+    n = len(ops)
+    while n and ops[n - 1].name in geometry:
+        n -= 1
+    scale, quality, state = 1.0, operations.DEFAULT_RESIZE_QUALITY, (0, 0)
+    for op in ops[n:]:
+        if op.name == "resize":
+            scale *= float(op.params[0])
+            quality = op.params[1] if len(op.params) > 1 else operations.DEFAULT_RESIZE_QUALITY
+        elif op.name in operations.ORIENTATION_OPS:
+            state = _compose_orientation(state, op)
+    return n, scale, quality, state
+
+
+def geometry_ops(scale: float, quality: str, flipped: int, turns: int) -> Tuple[Op, ...]:
+    """The shortest op list for a geometry: [resize] [flip h] [rotate]."""
+    ops: Tuple[Op, ...] = ()
+    if not math.isclose(scale, 1.0, rel_tol=1e-9):
+        ops += (Op("resize", (scale, quality)),)
+    return ops + orientation_ops(flipped, turns)
+
+
+def orientation_view(image, flipped: int, turns: int):
+    """
+    The oriented image as a NumPy view: nothing is copied. Slicing it is
+    free too, so the display crops the visible part and only that crop
+    gets copied (by the cv2 call that resamples it).
+    """
+    if flipped:
+        image = image[:, ::-1]
+    return np.rot90(image, -turns) if turns else image
+
+
+def _orient(image, flipped: int, turns: int):
+    """Applies a combined orientation with the fewest cv2 calls."""
+    rotations = {
+        1: cv2.ROTATE_90_CLOCKWISE,
+        2: cv2.ROTATE_180,
+        3: cv2.ROTATE_90_COUNTERCLOCKWISE,
+    }
+    if not flipped:
+        return image.copy() if turns == 0 else cv2.rotate(image, rotations[turns])
+    if turns == 0:
+        return cv2.flip(image, 1)
+    if turns == 2:
+        return cv2.flip(image, 0)
+    if turns == 3:
+        return cv2.transpose(image)
+    return cv2.flip(cv2.transpose(image), -1)
+
+
+# ---------- Planning (fusion) ----------
+
+def plan(ops, shape) -> List[Step]:
+    """
+    Turns a list of recorded ops into a shorter list of fused steps.
+    `shape` is the input shape (needed to work out resize target sizes).
+    """
+    steps: List[Step] = []
+    i = 0
+    while i < len(ops):
+        op = ops[i]
+
+        if op.name in operations.POINTWISE_OPS:
+            chain = []
+            while i < len(ops) and ops[i].name in operations.POINTWISE_OPS:
+                chain.append(operations.POINTWISE_OPS[ops[i].name](*ops[i].params))
+                i += 1
+            steps.append(Step("lut", (pointwise.compose(chain),)))
+            continue
+
+        if op.name in operations.ORIENTATION_OPS:
+            state = (0, 0)
+            while i < len(ops) and ops[i].name in operations.ORIENTATION_OPS:
+                state = _compose_orientation(state, ops[i])
+                shape = operations.output_shape(ops[i].name, ops[i].params, shape)
+                i += 1
+            if state != (0, 0):
+                steps.append(Step("orient", state))
+            continue
+
+        if op.name == "resize":
+            while i < len(ops) and ops[i].name == "resize":
+                shape = operations.output_shape("resize", ops[i].params, shape)
+                quality = ops[i].params[1] if len(ops[i].params) > 1 \
+                    else operations.DEFAULT_RESIZE_QUALITY
+                i += 1
+            steps.append(Step("resize", ((shape[1], shape[0]), quality)))
+            continue
+
+        steps.append(Step("op", (op.name, op.params)))
+        shape = operations.output_shape(op.name, op.params, shape)
+        i += 1
+    return steps
+
+
+def run_step(image, step: Step, tiler=None, owned: bool = False):
+    """
+    Executes one fused step.
+    `tiler` (a tiling.TiledExecutor) runs large images tile by tile.
+    owned=True: `image` is a scratch buffer nobody else sees, so a region
+    edit may write into it instead of copying it.
+    """
+    if not TRACER.enabled:
+        return _run_step(image, step, tiler, owned)
+    name = step.args[0] if step.kind == "op" else step.kind
+    with TRACER.span("graph." + name, "graph") as span:
+        result = _run_step(image, step, tiler, owned)
+        span.nbytes = result.nbytes
+    return result
+
+
+def _run_step(image, step: Step, tiler=None, owned: bool = False):
+    tiled = tiler is not None and tiler.should_tile(image)
+    if step.kind == "lut":
+        return tiler.lut(image, step.args[0]) if tiled else cv2.LUT(image, step.args[0])
+    if step.kind == "orient":
+        return _orient(image, *step.args)
+    if step.kind == "resize":
+        return operations.resample(image, *step.args)
+    name, params = step.args
+    if name == "region":
+        return operations.region(image, *params, out=image if owned else None)
+    if tiled and tiler.supports(name):
+        return tiler.run(image, name, params)
+    return operations.run(image, name, params)
+
+
+def execute(image, ops, tiler=None):
+    """Plans and runs a list of ops on `image`."""
+    if not ops:
+        return image
+    source = image
+    for step in plan(ops, image.shape):
+        # Buffers made by earlier steps are ours; `source` is the caller's
+        image = run_step(image, step, tiler, owned=image is not source and image.flags.writeable)
+    return image
+
+
+def shape_after(ops, shape) -> Tuple[int, ...]:
+    """Shape of the result of `ops` on an image of `shape` (nothing is run)."""
+    for op in ops:
+        shape = operations.output_shape(op.name, op.params, shape)
+    return tuple(shape)
+
+
+def replay(state: "LazyImage", name: str, params: Tuple = ()) -> "LazyImage":
+    """Records op `name` on a snapshot (used by HistoryManager to rebuild states)."""
+    return state.then(Op(name, tuple(params)))
+
+
+# Every LazyImage with new pixels gets the next number (thread-safe under the GIL)
+_versions = itertools.count(1)
+
+
+def _read_only(image):
+    image.setflags(write=False)
+    return image
+
+
+# ---------- Lazy image ----------
+
+class PendingSource:
+    """
+    Full-resolution source pixels that are still being produced (e.g. decoded
+    on a background thread), plus a reduced copy that is already available.
+
+    A LazyImage built on it previews from the reduced copy (as if it were a
+    level of its pyramid) and only waits for the full pixels when it has to
+    (evaluate, save, 1:1 display).
+    """
+
+    def __init__(self, shape: Tuple[int, ...], reduced, level: int, future) -> None:
+        self.shape = tuple(shape)
+        self.reduced = _read_only(reduced)
+        self.level = level  # reduced = pyramid level `level` (1 / 2**level size)
+        self._future = future
+
+    def done(self) -> bool:
+        return self._future.done()
+
+    def result(self):
+        """Full pixels (waits for them)."""
+        return self._future.result()
+
+    def error(self) -> Optional[BaseException]:
+        """The exception the producer raised, if it is done and failed."""
+        return self._future.exception() if self._future.done() else None
+
+
+class LazyImage:
+    """
+    An image described as "source pixels + ops still to run".
+
+    Why immutable:
+    - history can keep a LazyImage without copying any pixels,
+      and undo/redo can hand the same object back safely.
+    - evaluated pixels are cached (read-only), so each node runs at most once.
+
+    Versions:
+    - every LazyImage has a version number; two snapshots with the same
+      version have the same pixels. Caches keyed by pixels (display pyramid,
+      results) use the version instead of hashing the image.
+
+    Proxy previews:
+    - for display, ops run on a downscaled "proxy" (a level of an image
+      pyramid of the source, matched to the viewport), not on the full image.
+      Full resolution only runs in evaluate() (save, export, eager filters).
+    """
+
+    __slots__ = ("_source", "_ops", "_result", "_partial", "_pyramid", "_proxy", "_version")
+
+    def __init__(self, source, ops: Tuple[Op, ...] = (), pyramid=None, proxy=None) -> None:
+        pending = isinstance(source, PendingSource)
+        self._source = source if pending else _read_only(source)
+        self._ops = tuple(ops)
+        self._version = next(_versions)
+        self._result: Optional[np.ndarray] = None if self._ops or pending else self._source
+        # (number of ops already run, pixels) - set by preview()
+        self._partial: Optional[Tuple[int, np.ndarray]] = None
+        # Pyramid of the source (level -> pixels, each level half the size).
+        # Shared by every LazyImage built on the same source.
+        if pyramid is None:
+            pyramid = {0: self._source}
+            if pending:
+                pyramid[source.level] = source.reduced
+        self._pyramid = pyramid
+        # Newest proxy result: (pyramid level, number of ops run, pixels)
+        self._proxy: Optional[Tuple[int, int, np.ndarray]] = proxy
+
+    @property
+    def version(self) -> int:
+        """Identifies these pixels: changes with every edit, never with copy()."""
+        return self._version
+
+    @property
+    def ops(self) -> Tuple[Op, ...]:
+        """Ops still waiting to run (empty once evaluated)."""
+        return () if self._result is not None else self._ops
+
+    @property
+    def shape(self) -> Tuple[int, ...]:
+        """Shape of the final image, worked out without running anything."""
+        if self._result is not None:
+            return self._result.shape
+        return shape_after(self._ops, self._source.shape)
+
+    def is_evaluated(self) -> bool:
+        return self._result is not None
+
+    def then(self, op: Op) -> "LazyImage":
+        """
+        Returns a NEW LazyImage with one more op recorded.
+        A resize / rotation / flip is merged with the ones just before it
+        (e.g. two flips cancel out), so repeated geometry changes cost nothing
+        until pixels are needed and then resample ONCE from the last
+        pixel-changing state - even if this snapshot was evaluated already.
+        """
+        if op.name in operations.GEOMETRY_OPS:
+            merged = self._then_geometry(op)
+            if merged is not None:
+                return merged
+        if self._result is None or self._result is self._source:
+            # Same source: share its pyramid and continue from our proxy.
+            ops = self._ops if self._result is None else ()
+            return LazyImage(self._source, ops + (op,), self._pyramid, self._proxy)
+        # Evaluated: start from the result. Our proxy (if it covers every op)
+        # is a proxy of that result, so keep using it.
+        seed = None
+        if self._proxy is not None and self._proxy[1] == len(self._ops):
+            seed = (self._proxy[0], 0, self._proxy[2])
+        return LazyImage(self._result, (op,), proxy=seed)
+
+    def _then_geometry(self, op: Op) -> Optional["LazyImage"]:
+        """then() for a geometry op, or None if the pixels it should start from are gone."""
+        ops = () if self._result is self._source else self._ops
+        n, scale, quality, state = split_geometry(ops)
+        keep = self._partial if self._partial is not None and self._partial[0] <= n else None
+        if self._result is not None and n > 0 and (keep is None or keep[0] != n):
+            return None  # evaluated: the state before the geometry was not kept
+        if op.name == "resize":
+            scale *= operations.clamp_scale(op.params[0])
+            quality = op.params[1] if len(op.params) > 1 else operations.DEFAULT_RESIZE_QUALITY
+            if quality not in operations.RESIZE_QUALITIES:
+                raise ValueError(f"Unknown resize quality: {quality}")
+        else:
+            state = _compose_orientation(state, op)
+        proxy = self._proxy if self._proxy is not None and self._proxy[1] <= n else None
+        image = LazyImage(self._source, ops[:n] + geometry_ops(scale, quality, *state),
+                          self._pyramid, proxy)
+        if image._result is None:
+            image._partial = keep
+        return image
+
+    def copy(self) -> "LazyImage":
+        """LazyImage never changes, so a "copy" can share the same object."""
+        return self
+
+    @property
+    def nbytes(self) -> int:
+        """
+        Pixel memory this snapshot keeps alive on its own.
+        The source is only counted for a root snapshot (no ops) - other
+        snapshots share it.
+        """
+        total = 0
+        if self._result is not None:
+            total += self._result.nbytes
+        if self._partial is not None:
+            total += self._partial[1].nbytes
+        if self._proxy is not None:
+            total += self._proxy[2].nbytes
+        return total
+
+    def rebase(self, old, new) -> "LazyImage":
+        """
+        Returns an equivalent LazyImage that reads `new` wherever this one
+        uses the array `old` (same pixels, e.g. a memory-mapped copy on disk),
+        so `old` can be freed. Returns self if `old` is not used.
+        """
+        if self._result is old:
+            image = LazyImage(new)
+        elif self._source is old:
+            image = LazyImage(new, self._ops)
+            image._result = self._result
+        else:
+            return self
+        image._version = self._version  # same pixels
+        return image
+
+    def drop_caches(self) -> None:
+        """
+        Forgets the cached proxy / partial pixels (they can be recomputed).
+        Used by history for snapshots that are no longer on screen.
+        """
+        self._partial = None
+        self._proxy = None
+
+    def _full_source(self):
+        """Source pixels at full resolution (waits once for a PendingSource)."""
+        if isinstance(self._source, PendingSource):
+            full = _read_only(self._source.result())
+            if self._pyramid.get(0) is self._source:
+                self._pyramid[0] = full
+            self._source = full  # same image, so the snapshot stays "unchanged"
+        return self._source
+
+    def is_pending(self) -> bool:
+        """True while the full-resolution source is still being produced."""
+        return isinstance(self._source, PendingSource) and not self._source.done()
+
+    def load_error(self) -> Optional[BaseException]:
+        """Why the full-resolution source could not be produced (None if it could, or still runs)."""
+        return self._source.error() if isinstance(self._source, PendingSource) else None
+
+    def evaluate(self, tiler=None):
+        """
+        Runs the fused graph (once) and returns read-only pixels.
+        If the chain ends in a resize, the pixels before the trailing
+        geometry are kept (as _partial): a later resize starts from them
+        again instead of resampling an already resampled image.
+        """
+        if self._result is None:
+            done, image = self._partial or (0, self._full_source())
+            n, scale, _, _ = split_geometry(self._ops)
+            base = 0 < n < len(self._ops) and scale != 1.0
+            if base and done < n:
+                image = _read_only(execute(image, self._ops[done:n], tiler))
+                done = n
+                self._partial = (n, image)
+            self._result = _read_only(execute(image, self._ops[done:], tiler))
+            if not base:
+                self._partial = None
+        return self._result
+
+    def pending_work(self):
+        """
+        (input pixels, ops) that evaluate() would run, or None if evaluated.
+        Lets the work run elsewhere (e.g. a worker process); hand the pixels
+        it produced to fulfil().
+        """
+        if self._result is not None:
+            return None
+        done, image = self._partial or (0, self._full_source())
+        return image, self._ops[done:]
+
+    def fulfil(self, pixels) -> None:
+        """Stores pixels computed from pending_work() as the evaluated result."""
+        if self._result is None:
+            self._result = _read_only(pixels)
+            self._partial = None
+
+    # ---------- Proxy (display) evaluation ----------
+
+    def _pyramid_level(self, level: int):
+        if level == 0:
+            return self._full_source()
+        # Start from the nearest level we already have (a PendingSource
+        # brings a reduced level with it, so we need not wait for level 0)
+        start = max(i for i in list(self._pyramid) if i <= level)
+        for i in range(start + 1, level + 1):
+            if i not in self._pyramid:
+                prev = self._pyramid[i - 1] if i > 1 else self._full_source()
+                size = ((prev.shape[1] + 1) // 2, (prev.shape[0] + 1) // 2)
+                # 2x2 box average: no half-pixel shift, unlike cv2.pyrDown
+                self._pyramid[i] = _read_only(cv2.resize(prev, size, interpolation=cv2.INTER_AREA))
+        return self._pyramid[level]
+
+    def _proxy_level(self, need: float) -> int:
+        """Smallest pyramid level that still has at least `need` x the source resolution."""
+        h, w = self._source.shape[:2]
+        level = 0
+        while 0.5 ** (level + 1) >= need and min(w, h) >> (level + 1) >= 8:
+            level += 1
+        if self.is_pending():
+            # Full pixels not decoded yet: use the reduced copy meanwhile
+            level = max(level, self._source.level)
+        return level
+
+    def _proxy_at(self, level: int, n: int):
+        """Result of the first n ops, computed on pyramid level `level`."""
+        if self._proxy is not None and self._proxy[0] == level and self._proxy[1] <= n:
+            _, done, image = self._proxy
+        else:
+            done, image = 0, self._pyramid_level(level)
+        if done < n:
+            # Pyramid width after `level` halvings (rounded up, see _pyramid_level).
+            w = self._source.shape[1]
+            for _ in range(level):
+                w = (w + 1) // 2
+            factor = w / self._source.shape[1]
+            # Pixel-sized parameters (e.g. blur kernel) shrink with the proxy.
+            ops = [Op(op.name, operations.scale_params(op.name, op.params, factor))
+                   for op in self._ops[done:n]]
+            image = _read_only(execute(image, ops))
+        self._proxy = (level, n, image)
+        return image
+
+    def preview(self, max_w: int, max_h: int, tiler=None):
+        """
+        Pixels for display, fitted inside max_w x max_h (never enlarged past
+        the real image size).
+
+        Why not just evaluate():
+        - the ops run on a pyramid level just big enough for the viewport,
+          so a preview of a 50 MP photo costs about as much as a 1 MP one.
+        - resizes and rotations / flips at the end of the chain are skipped;
+          resizes are folded into the ONE resample down to display size and
+          the orientation is applied to the small result.
+        """
+        image, (flipped, turns) = self.preview_parts(max_w, max_h, tiler)
+        if flipped or turns:
+            return _orient(image, flipped, turns)
+        return image
+
+    def preview_parts(self, max_w: int, max_h: int, tiler=None):
+        """
+        preview() as (pixels, (flipped, turns)): the trailing orientation is
+        NOT applied to the pixels yet. The display applies it to the part it
+        draws (orientation_view()), so even a full-resolution view never
+        rotates the whole image.
+        """
+        h, w = self.shape[:2]
+        scale = min(max_w / w, max_h / h, 1.0)
+        size = (max(1, int(w * scale)), max(1, int(h * scale)))
+
+        if self._result is not None:
+            n, state = len(self._ops), (0, 0)  # already oriented
+        else:
+            n, _, _, state = split_geometry(self._ops)
+        if state[1] % 2:
+            size = (size[1], size[0])  # before a quarter turn
+
+        # Display resolution relative to the source (resizes included).
+        sh, sw = self._source.shape[:2]
+        level = self._proxy_level(scale * (w * h / float(sw * sh)) ** 0.5)
+
+        if level > 0:
+            base = self._proxy_at(level, n)
+        elif self._result is not None:
+            base = self._result
+        elif n == len(self._ops):
+            base = self.evaluate(tiler)
+        elif n == 0:
+            base = self._full_source()
+        else:
+            if self._partial is None or self._partial[0] != n:
+                self._partial = (n, _read_only(execute(self._full_source(), self._ops[:n], tiler)))
+            base = self._partial[1]
+
+        if (base.shape[1], base.shape[0]) != size:
+            interp = cv2.INTER_AREA if size[0] < base.shape[1] else cv2.INTER_LINEAR
+            base = cv2.resize(base, size, interpolation=interp)
+        return base, state
+
+    def needs_pixel_work(self) -> bool:
+        """
+        True if showing the full-resolution image needs more than a
+        rotation / flip of pixels that already exist (see preview_parts()).
+        """
+        if self._result is not None:
+            return False
+        n, _ = split_orientation(self._ops)
+        if self._partial is not None and self._partial[0] == n:
+            return False
+        return n > 0
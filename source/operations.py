@@ -0,0 +1,301 @@
+"""
+Image operation kernels (OpenCV).
+
+Every function here is "pure": it takes an image array and returns a NEW
+image array, without touching any object state.
+
+Why this file exists:
+- ImageProcessor (runs an op right away) and the lazy graph in op_graph.py
+  (runs ops later, fused) must produce exactly the same pixels.
+  Keeping the kernels in one place guarantees that.
+- Ops are identified by name + parameters, so a list of edits can be
+  recorded, planned and replayed.
+"""
+
+from __future__ import annotations
+
+import numbers
+from typing import Tuple
+
+import cv2
+
+import blur_engine
+import canny
+import pointwise
+
+
+# Ops that map each pixel value on its own -> folded into one lookup table.
+POINTWISE_OPS = {
+    "brightness": pointwise.brightness,
+    "contrast": pointwise.contrast,
+    "gamma": pointwise.gamma,
+    "levels": pointwise.levels,
+    "invert": pointwise.invert,
+    "curves": pointwise.curves,
+}
+
+# Ops that only move pixels around (rotate 90/180/270, flip).
+ORIENTATION_OPS = ("rotate", "flip")
+
+# Ops that change the geometry only: a run of them is recorded as ONE
+# resize from the last pixel-changing state (see op_graph.LazyImage.then).
+GEOMETRY_OPS = ("resize",) + ORIENTATION_OPS
+
+# Resize quality tiers, fastest first -> OpenCV interpolation.
+# "pyramid" halves the image with cv2.pyrDown first (large reductions).
+RESIZE_QUALITIES = {
+    "nearest": cv2.INTER_NEAREST,
+    "linear": cv2.INTER_LINEAR,
+    "pyramid": cv2.INTER_AREA,
+    "area": cv2.INTER_AREA,
+    "lanczos": cv2.INTER_LANCZOS4,
+}
+DEFAULT_RESIZE_QUALITY = "area"
+
+# Allowed scale of a single resize edit
+MIN_SCALE, MAX_SCALE = 0.1, 5.0
+
+# Ops that can be applied to a rectangle only (they keep the image size).
+REGION_OPS = ("grayscale", "blur", "edges") + tuple(POINTWISE_OPS)
+
+# Extra context read around a region for edges: Canny's hysteresis follows
+# edges across the region border for this many pixels.
+REGION_EDGE_MARGIN = 32
+
+
+# ---------- Kernels ----------
+
+def grayscale(image):
+    """
+    Converts the image to grayscale: ONE channel, a third of the pixels of
+    BGR for every later op, history entry and save. The display converts
+    it when drawing (display_cache.to_rgb).
+    """
+    if image.ndim == 2:
+        return image.copy()
+    return cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+
+
+def blur(image, intensity):
+    """
+    Applies Gaussian blur with adjustable intensity.
+    OpenCV requires odd kernel width/height, so we force odd.
+    Large kernels use a constant-time approximation (blur_engine.py).
+    """
+    return blur_engine.gaussian(image, blur_engine.kernel_size(intensity))
+
+
+def edges(image, t1=50, t2=150):
+    """
+    Canny edge detection with thresholds t1/t2 (uses grayscale internally).
+    Returns a single-channel 0/255 map, like grayscale().
+    Gradients are cached per image (canny.CACHE): trying other thresholds
+    on the same pixels only reruns suppression + hysteresis.
+    """
+    return canny.edges(image, t1, t2)
+
+
+def rotate(image, angle: int):
+    """Rotate image by 90, 180, or 270 degrees."""
+    if angle == 90:
+        return cv2.rotate(image, cv2.ROTATE_90_CLOCKWISE)
+    if angle == 180:
+        return cv2.rotate(image, cv2.ROTATE_180)
+    if angle == 270:
+        return cv2.rotate(image, cv2.ROTATE_90_COUNTERCLOCKWISE)
+    return image.copy()
+
+
+def flip(image, mode: str):
+    """Flip image horizontally ('h') or vertically ('v')."""
+    if mode == "h":
+        return cv2.flip(image, 1)
+    if mode == "v":
+        return cv2.flip(image, 0)
+    return image.copy()
+
+
+def clamp_scale(scale) -> float:
+    """A resize edit's scale, clamped to MIN_SCALE - MAX_SCALE."""
+    return max(MIN_SCALE, min(float(scale), MAX_SCALE))
+
+
+def resized_size(width: int, height: int, scale) -> Tuple[int, int]:
+    """
+    Returns the (width, height) a resize by `scale` produces.
+    Not clamped: a recorded resize may be several edits combined.
+    """
+    scale_f = float(scale)
+    return max(1, int(width * scale_f)), max(1, int(height * scale_f))
+
+
+def resize(image, scale, quality=DEFAULT_RESIZE_QUALITY):
+    """Resize/scale image by `scale`, with a quality tier from RESIZE_QUALITIES."""
+    h, w = image.shape[:2]
+    return resample(image, resized_size(w, h, scale), quality)
+
+
+def resample(image, size: Tuple[int, int], quality=DEFAULT_RESIZE_QUALITY):
+    """
+    Resamples to size (width, height).
+    "pyramid": while the image is still at least twice the target size,
+    cv2.pyrDown halves it (a fixed 5x5 filter, cheap per output pixel);
+    the last step is an area average. Enlarging falls back to "linear".
+    """
+    if quality not in RESIZE_QUALITIES:
+        raise ValueError(f"Unknown resize quality: {quality}")
+    source = image
+    if quality == "pyramid":
+        if size[0] > image.shape[1] or size[1] > image.shape[0]:
+            quality = "linear"
+        while image.shape[1] >= 2 * size[0] and image.shape[0] >= 2 * size[1]:
+            image = cv2.pyrDown(image)
+    if (image.shape[1], image.shape[0]) == size:
+        return image.copy() if image is source else image
+    return cv2.resize(image, size, interpolation=RESIZE_QUALITIES[quality])
+
+
+def region_halo(name: str, params: Tuple = ()) -> int:
+    """Pixels of context op `name` needs around a region."""
+    if name == "blur":
+        ksize = blur_engine.kernel_size(params[0] if params else 1)
+        halo = blur_engine.halo(ksize)
+        return ksize // 2 if halo is None else halo  # pyramid: the Gaussian's reach
+    if name == "edges":
+        return canny.HALO + REGION_EDGE_MARGIN
+    return 0
+
+
+def region_rect(shape, x, y, w, h) -> Tuple[int, int, int, int]:
+    """The rectangle clipped to an image of `shape`, as (x0, y0, x1, y1)."""
+    height, width = shape[:2]
+    x0, y0 = min(max(int(x), 0), width), min(max(int(y), 0), height)
+    return x0, y0, min(max(int(x + w), x0), width), min(max(int(y + h), y0), height)
+
+
+def region(image, x, y, w, h, name, params=(), out=None):
+    """
+    Runs op `name` on the rectangle (x, y, w, h) only.
+    The op reads a NumPy view of the rectangle plus a halo (the context a
+    blur / edge detection needs), so its cost follows the rectangle, not
+    the image. The result is written into `out` - a copy of `image` by
+    default, or `image` itself when the caller owns it.
+    A single-channel result (grayscale, edges) is written to every channel.
+    """
+    if name not in REGION_OPS:
+        raise ValueError(f"Operation {name} cannot be applied to a region")
+    if out is None:
+        out = image.copy()
+    x0, y0, x1, y1 = region_rect(image.shape, x, y, w, h)
+    if x1 <= x0 or y1 <= y0:
+        return out
+    halo = region_halo(name, params)
+    hx0, hy0, hx1, hy1 = region_rect(image.shape, x0 - halo, y0 - halo,
+                                     x1 - x0 + 2 * halo, y1 - y0 + 2 * halo)
+    patch = run(image[hy0:hy1, hx0:hx1], name, params)[y0 - hy0:y1 - hy0, x0 - hx0:x1 - hx0]
+    if patch.ndim < image.ndim:
+        patch = patch[..., None]
+    out[y0:y1, x0:x1] = patch
+    return out
+
+
+KERNELS = {
+    "grayscale": grayscale,
+    "blur": blur,
+    "edges": edges,
+    "rotate": rotate,
+    "flip": flip,
+    "resize": resize,
+    "region": region,
+}
+
+
+# ---------- Helpers used by the lazy graph ----------
+
+def is_known(name: str) -> bool:
+    """True if `name` is an op this module can run."""
+    return name in KERNELS or name in POINTWISE_OPS
+
+
+def run(image, name: str, params: Tuple = ()):
+    """Runs a single op by name."""
+    if name in POINTWISE_OPS:
+        return pointwise.apply(image, [POINTWISE_OPS[name](*params)])
+    if name not in KERNELS:
+        raise ValueError(f"Unknown operation: {name}")
+    return KERNELS[name](image, *params)
+
+
+def normalize(name: str, params: Tuple = ()) -> Tuple:
+    """
+    Canonical parameters of an op, for cache keys: parameters that give
+    the same pixels compare equal (blur 4 and 5 are both a 5 px kernel,
+    contrast 7 is clamped to 3.0, edges() means edges(50, 150), ...).
+    """
+    params = tuple(_plain(value) for value in params)
+    if name in POINTWISE_OPS:
+        return POINTWISE_OPS[name](*params).params
+    if name == "blur":
+        return (blur_engine.kernel_size(params[0] if params else 1),)
+    if name == "edges":
+        return params + (50, 150)[len(params):]
+    if name == "resize" and params:
+        return (clamp_scale(params[0]), params[1] if len(params) > 1 else DEFAULT_RESIZE_QUALITY)
+    if name == "region" and len(params) == 6:
+        return params[:5] + (normalize(params[4], params[5]),)
+    return params
+
+
+def _plain(value):
+    """Numbers as int when whole (20.0 -> 20), sequences as tuples."""
+    if isinstance(value, (list, tuple)):
+        return tuple(_plain(item) for item in value)
+    if isinstance(value, numbers.Real) and not isinstance(value, bool):
+        value = float(value)
+        return int(value) if value.is_integer() else value
+    return value
+
+
+def output_shape(name: str, params: Tuple, shape: Tuple[int, ...]) -> Tuple[int, ...]:
+    """
+    Works out the shape an op produces WITHOUT running it.
+    Lets the GUI show the new size of a lazy (not yet evaluated) image.
+    """
+    h, w = shape[:2]
+    rest = tuple(shape[2:])
+    if name in ("grayscale", "edges"):
+        return (h, w)  # single channel
+    if name == "rotate" and params and params[0] in (90, 270):
+        return (w, h) + rest
+    if name == "resize":
+        new_w, new_h = resized_size(w, h, params[0])
+        return (new_h, new_w) + rest
+    return tuple(shape)
+
+
+def scale_params(name: str, params: Tuple, factor: float) -> Tuple:
+    """
+    Adapts pixel-sized parameters when an op runs on a scaled-down copy
+    (e.g. a 31 px blur on a quarter-size proxy becomes an 8 px blur).
+    """
+    if name == "blur" and params:
+        return (max(1, int(round(float(params[0]) * factor))),)
+    if name == "region":
+        x, y, w, h, inner, inner_params = params
+        return (int(x * factor), int(y * factor), max(1, round(w * factor)),
+                max(1, round(h * factor)), inner, scale_params(inner, inner_params, factor))
+    return tuple(params)
+
+
+def inverse(name: str, params: Tuple = ()):
+    """
+    Returns (name, params) of the op that EXACTLY undoes this one, or None.
+    Only lossless ops qualify: 90-degree rotations, flips and invert.
+    """
+    if name == "rotate" and params and params[0] in (90, 180, 270):
+        return "rotate", (360 - params[0],)
+    if name == "flip" and params and params[0] in ("h", "v"):
+        return "flip", tuple(params)
+    if name == "invert":
+        return "invert", ()
+    return None
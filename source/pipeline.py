@@ -0,0 +1,208 @@
+"""
+Streaming decode -> process -> encode pipeline for bulk jobs.
+
+Three stages run at the same time, each on its own threads:
+    reader  (read file + decode)  --queue-->
+    worker  (ImageProcessor ops)  --queue-->
+    writer  (encode + write file)
+
+Why:
+- ImageProcessor.load/save are synchronous, so done one after the other
+  disk I/O, decoding, filtering and encoding simply add up.
+  Here they overlap, so throughput gets close to the SLOWEST stage
+  instead of the sum of all three (OpenCV releases the GIL).
+- The queues are bounded: a fast reader blocks when the workers fall behind
+  (backpressure), so only a few decoded images are in memory at once.
+
+Stopping:
+- a caller may stop reading run() early; the stages would then block on
+  full queues forever. run() sets a stop event when it ends, and every
+  queue wait gives up once it is set.
+"""
+
+from __future__ import annotations
+
+import os
+import queue
+import threading
+import time
+from typing import Dict, Iterable, Iterator, Optional, Tuple
+
+import cv2
+
+from batch import BatchResult, Recipe
+from image_processor import ImageProcessor
+from op_graph import LazyImage
+
+
+_STOP = object()
+
+# How often a blocked queue wait checks the stop event
+_POLL_S = 0.1
+
+
+def _put(box: queue.Queue, item, stop: threading.Event) -> bool:
+    """Puts item on box, waiting for room. False if the pipeline was stopped meanwhile."""
+    while not stop.is_set():
+        try:
+            box.put(item, timeout=_POLL_S)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+
+def _get(box: queue.Queue, stop: threading.Event):
+    """Next item of box, or _STOP once the pipeline was stopped."""
+    while not stop.is_set():
+        try:
+            return box.get(timeout=_POLL_S)
+        except queue.Empty:
+            pass
+    return _STOP
+
+
+class _Job:
+    """One image travelling through the pipeline."""
+
+    __slots__ = ("source", "target", "start", "image", "processor", "megapixels", "error")
+
+    def __init__(self, source: str, target: str) -> None:
+        self.source = source
+        self.target = target
+        self.start = time.perf_counter()
+        self.image = None
+        self.processor: Optional[ImageProcessor] = None
+        self.megapixels = 0.0
+        self.error: Optional[str] = None
+
+
+class StreamingPipeline:
+    """
+    Runs a recipe over many images with overlapping reader/worker/writer stages.
+
+    Usage:
+        pipe = StreamingPipeline(recipe, workers=4)
+        for result in pipe.run([(src, dst), ...]):
+            print(result)
+    """
+
+    def __init__(self, recipe: Recipe, readers: int = 2, workers: Optional[int] = None,
+                 writers: int = 2, queue_size: Optional[int] = None) -> None:
+        self._recipe = recipe
+        self._readers = max(1, readers)
+        self._workers = max(1, workers or os.cpu_count() or 1)
+        self._writers = max(1, writers)
+        # Max images waiting between two stages (caps memory).
+        self._queue_size = max(1, queue_size or 2 * self._workers)
+        self._busy: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def stage_seconds(self) -> Dict[str, float]:
+        """Total busy time per stage (shows which stage is the bottleneck)."""
+        return dict(self._busy)
+
+    # ---------- Stage bodies ----------
+
+    def _read(self, job: _Job) -> None:
+        job.start = time.perf_counter()
+        job.image = cv2.imread(job.source, cv2.IMREAD_ANYCOLOR)
+        if job.image is None:
+            job.error = "Could not read image. Please use JPG, PNG, or BMP."
+
+    def _process(self, job: _Job) -> None:
+        processor = ImageProcessor()
+        # Hand the decoded buffer over as-is (no copy).
+        processor.set_image(LazyImage(job.image))
+        job.image = None
+        w, h = processor.get_dimensions()
+        for name, params in self._recipe:
+            processor.record(name, *params)
+        processor.evaluate()
+        job.processor = processor
+        job.megapixels = w * h / 1e6
+
+    def _write(self, job: _Job) -> None:
+        job.processor.save(job.target)
+        job.processor = None
+
+    # ---------- Plumbing ----------
+
+    def _stage(self, name: str, body, inbox: queue.Queue, outbox: queue.Queue,
+               threads: int, downstream: int, stop: threading.Event) -> None:
+        """Starts `threads` threads running `body` on jobs from inbox to outbox."""
+        remaining = [threads]
+
+        def loop() -> None:
+            while True:
+                job = _get(inbox, stop)
+                if job is _STOP:
+                    break
+                if job.error is None:
+                    start = time.perf_counter()
+                    try:
+                        body(job)
+                    except Exception as e:
+                        job.error = str(e)
+                    with self._lock:
+                        self._busy[name] = self._busy.get(name, 0.0) + time.perf_counter() - start
+                if not _put(outbox, job, stop):  # blocks while the next stage is full
+                    break
+            with self._lock:
+                remaining[0] -= 1
+                last = remaining[0] == 0
+            if last:
+                # Last thread of this stage tells every next-stage thread to stop.
+                for _ in range(downstream):
+                    _put(outbox, _STOP, stop)
+
+        for _ in range(threads):
+            threading.Thread(target=loop, name=f"pipeline-{name}", daemon=True).start()
+
+    def run(self, jobs: Iterable[Tuple[str, str]]) -> Iterator[BatchResult]:
+        """
+        Processes (source, target) pairs, yielding a BatchResult per image
+        as soon as it has been written (not necessarily in input order).
+        If iterating `jobs` raises, the images fed so far are finished and
+        the error is raised here.
+        """
+        self._busy = {"read": 0.0, "process": 0.0, "write": 0.0}
+        todo: queue.Queue = queue.Queue(self._queue_size)
+        decoded: queue.Queue = queue.Queue(self._queue_size)
+        processed: queue.Queue = queue.Queue(self._queue_size)
+        done: queue.Queue = queue.Queue()
+
+        stop = threading.Event()
+        feed_error = []
+
+        self._stage("read", self._read, todo, decoded, self._readers, self._workers, stop)
+        self._stage("process", self._process, decoded, processed, self._workers, self._writers, stop)
+        self._stage("write", self._write, processed, done, self._writers, 1, stop)
+
+        def feed() -> None:
+            try:
+                for source, target in jobs:
+                    if not _put(todo, _Job(source, target), stop):
+                        return
+            except BaseException as e:
+                feed_error.append(e)
+            finally:
+                # Always: otherwise the readers, and so run(), wait forever
+                for _ in range(self._readers):
+                    _put(todo, _STOP, stop)
+
+        threading.Thread(target=feed, name="pipeline-feed", daemon=True).start()
+
+        try:
+            while True:
+                job = done.get()
+                if job is _STOP:
+                    break
+                seconds = time.perf_counter() - job.start
+                yield BatchResult(job.source, None if job.error else job.target,
+                                  seconds, job.megapixels, job.error)
+            if feed_error:
+                raise feed_error[0]
+        finally:
+            stop.set()
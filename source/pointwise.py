@@ -0,0 +1,148 @@
+"""
+Pointwise adjustment engine (lookup tables).
+
+A pointwise op changes each pixel value on its own, without looking at the
+neighbouring pixels (brightness, contrast, gamma, levels, invert, curves).
+For 8-bit images that means the whole op is just a 256-entry table:
+    new_value = table[old_value]
+
+Why this file exists:
+- cv2.convertScaleAbs works in floating point over every pixel.
+  cv2.LUT is a single integer memory pass.
+- Tables are tiny, so they are built once and cached per parameter set.
+- Several pointwise ops in a row fold into ONE table (table2[table1]),
+  so a whole edit chain still costs one pass over the image.
+"""
+
+from __future__ import annotations
+
+from functools import lru_cache
+from typing import Iterable, NamedTuple, Tuple
+
+import cv2
+import numpy as np
+
+
+_IDENTITY = np.arange(256, dtype=np.uint8)
+_IDENTITY.setflags(write=False)
+
+
+class PointwiseOp(NamedTuple):
+    """
+    One pointwise step: op name + parameter tuple.
+
+    Why a NamedTuple:
+    - it is hashable, so it can be used directly as a cache key.
+    """
+
+    name: str
+    params: Tuple = ()
+
+
+# ---------- Op constructors (normalise parameters) ----------
+
+def brightness(beta) -> PointwiseOp:
+    """Brightness shift (same behaviour as convertScaleAbs(alpha=1, beta))."""
+    return PointwiseOp("brightness", (int(beta),))
+
+
+def contrast(alpha) -> PointwiseOp:
+    """Contrast gain, clamped to 0.1 - 3.0 to avoid unusable images."""
+    return PointwiseOp("contrast", (max(0.1, min(float(alpha), 3.0)),))
+
+
+def gamma(value) -> PointwiseOp:
+    """Gamma correction (value > 1 brightens mid-tones), clamped to 0.1 - 10."""
+    return PointwiseOp("gamma", (max(0.1, min(float(value), 10.0)),))
+
+
+def levels(in_black=0, in_white=255, mid_gamma=1.0, out_black=0, out_white=255) -> PointwiseOp:
+    """Photoshop-style levels: input range, mid-tone gamma and output range."""
+    in_black = max(0, min(int(in_black), 254))
+    in_white = max(in_black + 1, min(int(in_white), 255))
+    out_black = max(0, min(int(out_black), 255))
+    out_white = max(0, min(int(out_white), 255))
+    mid_gamma = max(0.1, min(float(mid_gamma), 10.0))
+    return PointwiseOp("levels", (in_black, in_white, mid_gamma, out_black, out_white))
+
+
+def invert() -> PointwiseOp:
+    """Photographic negative."""
+    return PointwiseOp("invert")
+
+
+def curves(points) -> PointwiseOp:
+    """
+    Tone curve through (input, output) control points.
+    Values between points are linearly interpolated.
+    """
+    pts = tuple(sorted((int(x), int(y)) for x, y in points))
+    if len(pts) < 2:
+        raise ValueError("A curve needs at least two control points.")
+    return PointwiseOp("curves", pts)
+
+
+# ---------- Table builders ----------
+
+def _convert_scale_abs(alpha: float, beta: float) -> np.ndarray:
+    # Run OpenCV's own conversion over all 256 values, so the table gives
+    # exactly the same result as calling convertScaleAbs on the image.
+    return cv2.convertScaleAbs(_IDENTITY.reshape(1, 256), alpha=alpha, beta=beta).ravel()
+
+
+def _build(op: PointwiseOp) -> np.ndarray:
+    x = np.arange(256, dtype=np.float64)
+
+    if op.name == "brightness":
+        return _convert_scale_abs(1.0, op.params[0])
+    if op.name == "contrast":
+        return _convert_scale_abs(op.params[0], 0)
+    if op.name == "gamma":
+        table = 255.0 * (x / 255.0) ** (1.0 / op.params[0])
+    elif op.name == "levels":
+        in_black, in_white, mid_gamma, out_black, out_white = op.params
+        t = np.clip((x - in_black) / float(in_white - in_black), 0.0, 1.0)
+        table = out_black + (out_white - out_black) * t ** (1.0 / mid_gamma)
+    elif op.name == "invert":
+        table = 255.0 - x
+    elif op.name == "curves":
+        xs, ys = zip(*op.params)
+        table = np.interp(x, xs, ys)
+    else:
+        raise ValueError(f"Unknown pointwise operation: {op.name}")
+
+    return np.clip(np.rint(table), 0, 255).astype(np.uint8)
+
+
+@lru_cache(maxsize=256)
+def lut(op: PointwiseOp) -> np.ndarray:
+    """Returns the (cached, read-only) 256-entry table for one op."""
+    table = _build(op)
+    table.setflags(write=False)
+    return table
+
+
+@lru_cache(maxsize=256)
+def _compose_cached(ops: Tuple[PointwiseOp, ...]) -> np.ndarray:
+    table = _IDENTITY
+    for op in ops:
+        # Apply the earlier table first, then this op: next[previous].
+        table = lut(op)[table]
+    table.setflags(write=False)
+    return table
+
+
+def compose(ops: Iterable[PointwiseOp]) -> np.ndarray:
+    """Folds a chain of pointwise ops (applied in order) into one table."""
+    return _compose_cached(tuple(ops))
+
+
+def apply(image, ops: Iterable[PointwiseOp]):
+    """
+    Applies a chain of pointwise ops with ONE cv2.LUT pass.
+    Works for grayscale and colour uint8 images (same table on every channel).
+    """
+    ops = tuple(ops)
+    if not ops:
+        return image.copy()
+    return cv2.LUT(image, compose(ops))
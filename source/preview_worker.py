@@ -0,0 +1,122 @@
+"""
+Background worker for live slider previews.
+
+Why this class exists:
+- Tkinter is single-threaded: a filter that runs inside a slider callback
+  freezes the whole window until it finishes.
+- Here the filter runs on ONE background thread. Only the newest request
+  matters: a newer value replaces a job that has not started yet, and the
+  result of an older job that was already running is thrown away.
+- Results are handed back to the Tk thread with root.after() polling,
+  because Tk widgets must only be touched from the Tk thread.
+"""
+
+from __future__ import annotations
+
+import queue
+import threading
+from typing import Callable, Optional
+
+
+class PreviewWorker:
+    """
+    Runs the latest preview job off the Tk thread.
+
+    Usage:
+        worker = PreviewWorker(root)
+        worker.submit(callback, fn, *args)   # callback(result) runs on the Tk thread
+        worker.cancel()                      # forget anything still pending
+    """
+
+    def __init__(self, root, poll_ms: int = 16, on_error: Optional[Callable] = None) -> None:
+        self._root = root
+        self._poll_ms = poll_ms  # ~60 Hz
+        self._on_error = on_error
+        self._cond = threading.Condition()
+        self._job = None          # (generation, callback, fn, args) not started yet
+        self._generation = 0      # bumped on every submit/cancel
+        self._running = False
+        self._results: queue.Queue = queue.Queue()
+        self._polling = False
+        self._closed = False
+
+        self._thread = threading.Thread(target=self._loop, name="preview-worker", daemon=True)
+        self._thread.start()
+
+    # ---------- Tk thread API ----------
+
+    def submit(self, callback: Callable, fn: Callable, *args) -> None:
+        """Queues fn(*args); callback(result) is called later on the Tk thread."""
+        with self._cond:
+            self._generation += 1
+            # Replaces (cancels) a job that is still waiting.
+            self._job = (self._generation, callback, fn, args)
+            self._cond.notify()
+        if not self._polling:
+            self._polling = True
+            self._root.after(self._poll_ms, self._poll)
+
+    def cancel(self) -> None:
+        """Drops the waiting job and ignores the result of a running one."""
+        with self._cond:
+            self._generation += 1
+            self._job = None
+
+    def is_busy(self) -> bool:
+        with self._cond:
+            return self._job is not None or self._running
+
+    def close(self) -> None:
+        """Stops the worker thread (after the current job)."""
+        with self._cond:
+            self._closed = True
+            self._job = None
+            self._cond.notify()
+
+    def _poll(self) -> None:
+        latest = None
+        while True:
+            try:
+                latest = self._results.get_nowait()
+            except queue.Empty:
+                break
+
+        if latest is not None:
+            generation, callback, result, error = latest
+            # Only the newest job may update the screen.
+            if generation == self._generation:
+                if error is None:
+                    callback(result)
+                elif self._on_error is not None:
+                    self._on_error(error)
+
+        if self.is_busy() or not self._results.empty():
+            self._root.after(self._poll_ms, self._poll)
+        else:
+            self._polling = False
+
+    # ---------- Worker thread ----------
+
+    def _loop(self) -> None:
+        while True:
+            with self._cond:
+                while self._job is None and not self._closed:
+                    self._cond.wait()
+                if self._closed:
+                    return
+                generation, callback, fn, args = self._job
+                self._job = None
+                self._running = True
+
+            result, error = None, None
+            try:
+                result = fn(*args)
+            except Exception as e:
+                error = e
+
+            with self._cond:
+                # Publish before clearing _running, so _poll() never stops
+                # polling between the two.
+                if generation == self._generation:
+                    self._results.put((generation, callback, result, error))
+                self._running = False
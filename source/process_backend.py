@@ -0,0 +1,211 @@
+"""
+Process backend: runs op chains in a small pool of worker processes.
+
+Why this module exists:
+- OpenCV releases the GIL, but everything around it (planning, NumPy
+  glue, the Tk event loop itself) shares one interpreter; a full-resolution
+  render of a big image still makes the window stutter.
+- worker processes run truly in parallel, one job per core, so independent
+  jobs (several snapshots, a render next to a save) do not queue behind
+  each other.
+- pixels are NOT pickled: the input and the output live in
+  multiprocessing.shared_memory blocks that both sides map. Only the block
+  names, shapes and the ops travel through the pool's pipe. The result is
+  handed back as an array over its block, without a copy, and a result
+  passed in again (the next job's input) reuses its block.
+
+Ownership:
+- every block is created (and unlinked) by the process that submits the
+  jobs; workers only attach to them. A block lives as long as the array it
+  belongs to: the input array it was copied from, or the result array.
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+import weakref
+from concurrent.futures import CancelledError, Future, ProcessPoolExecutor
+from multiprocessing import get_context, shared_memory
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+
+import cv2
+import numpy as np
+
+import op_graph
+
+
+def default_workers() -> int:
+    """A small pool: one core is left for the GUI, at most 4 workers."""
+    return max(1, min(4, (os.cpu_count() or 2) - 1))
+
+
+# ---------- Worker process ----------
+
+def _init_worker(threads: int) -> None:
+    # Each worker runs one job at a time; its share of the cores is enough
+    # (the default, one OpenCV thread per core in every worker, oversubscribes)
+    cv2.setNumThreads(threads)
+
+
+def _attach(name: str) -> shared_memory.SharedMemory:
+    return shared_memory.SharedMemory(name=name)
+
+
+def _run(src: str, src_shape: Tuple[int, ...], dtype: str,
+         dst: str, dst_shape: Tuple[int, ...], ops: Tuple[op_graph.Op, ...]) -> None:
+    """Worker: runs `ops` on block `src` and writes the result into block `dst`."""
+    source, target = _attach(src), _attach(dst)
+    try:
+        _compute(source.buf, src_shape, target.buf, dst_shape, np.dtype(dtype), ops)
+    finally:
+        for block in (source, target):
+            try:
+                block.close()
+            except BufferError:
+                pass  # an error traceback still holds an array; unmapped at exit
+
+
+def _compute(src_buf, src_shape, dst_buf, dst_shape, dtype, ops) -> None:
+    image = np.ndarray(src_shape, dtype, buffer=src_buf)
+    image.setflags(write=False)  # other jobs may read the same block
+    result = op_graph.execute(image, ops)
+    if result.shape != tuple(dst_shape):
+        raise ValueError(f"Expected a {dst_shape} result, got {result.shape}")
+    np.copyto(np.ndarray(dst_shape, dtype, buffer=dst_buf), result)
+
+
+# ---------- Block bookkeeping (submitting process) ----------
+
+def _release(blocks: Dict[int, shared_memory.SharedMemory],
+             closing: List[shared_memory.SharedMemory], key: int) -> None:
+    """Frees the block of a dead array (weakref.finalize callback)."""
+    block = blocks.pop(key, None)
+    if block is None:
+        return
+    block.unlink()  # the name goes now; the mapping when the last view closes
+    try:
+        block.close()
+    except BufferError:
+        # The array is being deallocated right now and still holds the
+        # buffer: close on a later call (see ProcessBackend._reap)
+        closing.append(block)
+
+
+class ProcessBackend:
+    """
+    Runs op chains (op_graph.execute) in worker processes.
+
+    Usage:
+        backend = ProcessBackend()
+        future = backend.submit(pixels, ops)    # returns at once
+        ...
+        result = future.result()                # read-only ndarray
+        future.cancel()                         # or give up on it
+        backend.close()
+
+    Jobs submitted together run in parallel (up to `workers` at a time).
+    A job that already runs cannot be stopped halfway; cancelling it
+    discards its result as soon as it finishes.
+    """
+
+    def __init__(self, workers: Optional[int] = None) -> None:
+        self.workers = workers or default_workers()
+        threads = max(1, (os.cpu_count() or 1) // self.workers)
+        # "spawn": never fork a process that runs Tk and worker threads
+        self._pool = ProcessPoolExecutor(self.workers, mp_context=get_context("spawn"),
+                                         initializer=_init_worker, initargs=(threads,))
+        self._blocks: Dict[int, shared_memory.SharedMemory] = {}  # id(array) -> its block
+        self._closing: List[shared_memory.SharedMemory] = []
+        self._jobs: Set[Future] = set()
+        self._lock = threading.Lock()
+
+    # ---------- Shared memory ----------
+
+    def _reap(self) -> None:
+        for block in list(self._closing):
+            try:
+                block.close()
+            except BufferError:
+                continue
+            self._closing.remove(block)
+
+    def _adopt(self, array, block: shared_memory.SharedMemory) -> None:
+        self._blocks[id(array)] = block
+        weakref.finalize(array, _release, self._blocks, self._closing, id(array))
+
+    def _share(self, image) -> shared_memory.SharedMemory:
+        """The block holding `image`: its own if it is a result, else a new copy."""
+        block = self._blocks.get(id(image))
+        if block is None:
+            block = shared_memory.SharedMemory(create=True, size=max(1, image.nbytes))
+            np.copyto(np.ndarray(image.shape, image.dtype, buffer=block.buf), image)
+            self._adopt(image, block)
+        return block
+
+    # ---------- Jobs ----------
+
+    def submit(self, image, ops: Sequence[op_graph.Op]) -> Future:
+        """
+        Runs `ops` on `image` in a worker. Returns a Future of the result
+        (read-only pixels, backed by shared memory).
+        """
+        self._reap()
+        ops = tuple(ops)
+        shape = op_graph.shape_after(ops, image.shape)
+        source = self._share(image)
+        target = shared_memory.SharedMemory(
+            create=True, size=max(1, int(np.prod(shape)) * image.dtype.itemsize))
+        inner = self._pool.submit(_run, source.name, image.shape, image.dtype.str,
+                                  target.name, shape, ops)
+
+        outer: Future = Future()
+        with self._lock:
+            self._jobs.add(outer)
+        # Cancelled before a worker took it: drop it from the pool queue too
+        outer.add_done_callback(lambda f: f.cancelled() and inner.cancel())
+        dtype = image.dtype
+        # Keep the input alive until the worker is done with its block
+        inner.add_done_callback(lambda f: self._finish(f, outer, target, shape, dtype, image))
+        return outer
+
+    def _finish(self, inner: Future, outer: Future, target: shared_memory.SharedMemory,
+                shape, dtype, image) -> None:
+        with self._lock:
+            self._jobs.discard(outer)
+        error = CancelledError() if inner.cancelled() else inner.exception()
+        wanted = outer.set_running_or_notify_cancel()  # False: cancelled by the caller
+        if error is not None or not wanted:
+            target.close()
+            target.unlink()
+            if wanted:
+                outer.set_exception(error)
+            return
+        result = np.ndarray(shape, dtype, buffer=target.buf)
+        result.setflags(write=False)
+        self._adopt(result, target)
+        outer.set_result(result)
+
+    def map(self, jobs: Sequence[Tuple[object, Sequence[op_graph.Op]]]) -> List[Future]:
+        """Submits independent (image, ops) jobs at once; they run in parallel."""
+        return [self.submit(image, ops) for image, ops in jobs]
+
+    def busy(self) -> int:
+        """Number of jobs not finished yet."""
+        with self._lock:
+            return len(self._jobs)
+
+    def cancel_all(self) -> None:
+        with self._lock:
+            jobs = list(self._jobs)
+        for job in jobs:
+            job.cancel()
+
+    def close(self) -> None:
+        """
+        Cancels queued jobs and stops the workers (results already out stay
+        valid). Waits for jobs already running: leaving the pool behind
+        (wait=False) races with its exit handler on Python 3.11.
+        """
+        self.cancel_all()
+        self._pool.shutdown(wait=True, cancel_futures=True)
@@ -0,0 +1,123 @@
+"""
+Result cache: remembers the states recent edits produced.
+
+Users go back and forth between a few settings (contrast 1.2 vs 1.5,
+two edge thresholds), and undo an edit only to apply it again. Every time,
+the same op ran again on the same pixels.
+
+Why cache LazyImage states (not pixel arrays):
+- an edit is keyed by (input version, op name, normalized params). A LazyImage
+  version identifies its pixels, so the key says exactly what the result is.
+- a hit returns the SAME LazyImage as before: its full-resolution result,
+  its proxy preview and its version (so the display pyramid) all come back
+  with it, at no cost. Nothing is computed until pixels are needed, as
+  usual; whatever gets computed is then cached for free.
+- a live preview goes through the cache as well, so clicking Apply after
+  previewing reuses the preview's pixels.
+
+Memory:
+- entries are charged for the pixels the state caches on its own
+  (LazyImage.nbytes, as in HistoryManager), re-measured whenever the cache
+  trims, because a state caches pixels after it was stored. The least
+  recently used entries are dropped beyond max_bytes (or max_entries).
+
+Usage:
+    cache = ResultCache()
+    state = cache.then(state, Op("contrast", (1.5,)))
+    print(cache.stats())
+"""
+
+from __future__ import annotations
+
+import threading
+from collections import OrderedDict
+from typing import Hashable, NamedTuple, Tuple
+
+import operations
+from op_graph import LazyImage, Op
+
+
+DEFAULT_CACHE_BYTES = 256 * 1024 * 1024
+DEFAULT_MAX_ENTRIES = 256
+
+
+class CacheStats(NamedTuple):
+    """Counters of a ResultCache, for tuning its budget."""
+
+    hits: int
+    misses: int
+    evictions: int
+    entries: int
+    nbytes: int
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+
+class ResultCache:
+    """
+    LRU cache of edit results, in front of LazyImage.then().
+
+    Thread-safe: the preview worker thread and the Tk thread share one.
+    """
+
+    def __init__(self, max_bytes: int = DEFAULT_CACHE_BYTES,
+                 max_entries: int = DEFAULT_MAX_ENTRIES) -> None:
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[Hashable, ...], LazyImage]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def key(state: LazyImage, op: Op) -> Tuple[Hashable, ...]:
+        return (state.version, op.name, operations.normalize(op.name, op.params))
+
+    def then(self, state: LazyImage, op: Op) -> LazyImage:
+        """state.then(op), or the state an earlier identical call returned."""
+        key = self.key(state, op)
+        with self._lock:
+            result = self._entries.get(key)
+            if result is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return result
+            self.misses += 1
+        result = state.then(op)
+        with self._lock:
+            self._entries[key] = result
+            self._entries.move_to_end(key)
+            self._trim()
+        return result
+
+    def _trim(self) -> None:
+        # Newest entry is kept even if it alone is over budget: it is
+        # usually the state on screen, whose pixels are alive anyway
+        total = self._measure()
+        while len(self._entries) > 1 and (len(self._entries) > self.max_entries
+                                          or total > self.max_bytes):
+            _, state = self._entries.popitem(last=False)
+            total -= state.nbytes
+            self.evictions += 1
+
+    def _measure(self) -> int:
+        return sum(state.nbytes for state in self._entries.values())
+
+    def clear(self) -> None:
+        """Forgets every entry (e.g. a new image was opened); counters stay."""
+        with self._lock:
+            self._entries.clear()
+
+    @property
+    def nbytes(self) -> int:
+        with self._lock:
+            return self._measure()
+
+    def stats(self) -> CacheStats:
+        with self._lock:
+            return CacheStats(self.hits, self.misses, self.evictions,
+                              len(self._entries), self._measure())
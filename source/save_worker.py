@@ -0,0 +1,120 @@
+"""
+Background saving for the GUI.
+
+Why this class exists:
+- rendering the edits at full resolution and encoding (PNG compression
+  especially) can take seconds on a big image; done in the button callback
+  it freezes the whole window.
+- here saves run on ONE background thread, in the order they were asked
+  for (unlike previews, no save is ever skipped), and the user can keep
+  editing meanwhile: a save works on the snapshot taken when it started.
+- progress and results go back to the Tk thread with root.after() polling,
+  because Tk widgets must only be touched from the Tk thread.
+"""
+
+from __future__ import annotations
+
+import queue
+import threading
+import time
+from typing import Callable, Optional
+
+
+class SaveWorker:
+    """
+    Runs save jobs off the Tk thread, one at a time.
+
+    Usage:
+        worker = SaveWorker(root, on_progress, on_done)
+        worker.submit("photo.png", job)     # job(progress) runs on the worker thread
+    on_progress(name, stage, seconds) and on_done(name, error, seconds)
+    are called on the Tk thread.
+    """
+
+    def __init__(self, root, on_progress: Callable, on_done: Callable, poll_ms: int = 100) -> None:
+        self._root = root
+        self._on_progress = on_progress
+        self._on_done = on_done
+        self._poll_ms = poll_ms
+        self._jobs: queue.Queue = queue.Queue()
+        self._events: queue.Queue = queue.Queue()
+        self._pending = 0   # submitted, not reported done yet (Tk thread only)
+        self._current = None  # (name, stage, start) of the running job
+        self._polling = False
+        self._silent = False  # draining on exit: no callbacks any more
+
+        self._thread = threading.Thread(target=self._loop, name="save-worker", daemon=True)
+        self._thread.start()
+
+    # ---------- Tk thread API ----------
+
+    def submit(self, name: str, job: Callable) -> None:
+        """Queues job(progress); progress(stage) may be called to report a stage."""
+        self._pending += 1
+        self._jobs.put((name, job))
+        if not self._polling:
+            self._polling = True
+            self._root.after(self._poll_ms, self._poll)
+
+    def is_busy(self) -> bool:
+        return self._pending > 0
+
+    def wait(self, notify: bool = True) -> None:
+        """
+        Blocks until every queued save has finished (used on exit).
+        notify=False drops the progress / done callbacks: the window is
+        closing, so no status or message box should pop up any more.
+        """
+        self._silent = not notify
+        self._jobs.join()
+        self._poll()
+
+    def close(self) -> None:
+        """Stops the worker thread after the queued saves."""
+        self._jobs.put(None)
+
+    def _poll(self) -> None:
+        while True:
+            try:
+                event = self._events.get_nowait()
+            except queue.Empty:
+                break
+            kind, name, value, seconds = event
+            if kind == "progress":
+                self._current = (name, value, seconds)  # seconds = start time here
+            else:
+                self._pending -= 1
+                self._current = None
+                if not self._silent:
+                    self._on_done(name, value, seconds)
+
+        if self._current is not None and not self._silent:
+            name, stage, start = self._current
+            self._on_progress(name, stage, time.perf_counter() - start)
+
+        if self._pending > 0:
+            self._root.after(self._poll_ms, self._poll)
+        else:
+            self._polling = False
+
+    # ---------- Worker thread ----------
+
+    def _loop(self) -> None:
+        while True:
+            item = self._jobs.get()
+            if item is None:
+                self._jobs.task_done()
+                return
+            name, job = item
+            start = time.perf_counter()
+
+            def progress(stage: str) -> None:
+                self._events.put(("progress", name, stage, start))
+
+            error: Optional[Exception] = None
+            try:
+                job(progress)
+            except Exception as e:
+                error = e
+            self._events.put(("done", name, error, time.perf_counter() - start))
+            self._jobs.task_done()
@@ -0,0 +1,242 @@
+"""
+Tiled, multi-threaded execution for very large images.
+
+The image is cut into fixed-size tiles that are processed by a thread pool
+(OpenCV releases the GIL, so threads really run in parallel). Each worker
+writes its tile straight into the output, so besides the output image only
+a few tiles exist at any time.
+
+Why halos:
+- neighbourhood ops (blur, edges) need pixels from outside the tile.
+  Each tile is read with an overlap ("halo") and only its centre is kept,
+  so tile borders come out identical to a whole-image run.
+- Canny's hysteresis step is global (edges can run across many tiles).
+  Tiles are labelled separately and the labels are joined across tile seams,
+  which gives exactly the same result as one cv2.Canny call.
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+import blur_engine
+import canny
+import operations
+import pointwise
+
+
+Tile = Tuple[int, int, int, int]  # (y0, y1, x0, x1)
+
+
+class TiledExecutor:
+    """
+    Runs supported ops tile by tile across a thread pool.
+
+    Supported: pointwise ops (and fused lookup tables), grayscale, blur, edges.
+    Everything else (rotate, flip, resize) is left to the normal kernels.
+    """
+
+    TILED_OPS = ("grayscale", "blur", "edges") + tuple(operations.POINTWISE_OPS)
+
+    def __init__(self, tile_size: int = 1024, workers: Optional[int] = None) -> None:
+        self._tile_size = max(64, int(tile_size))
+        self._workers = workers or os.cpu_count() or 1
+        self._pool: Optional[ThreadPoolExecutor] = None
+        # The preview thread and the Tk thread both run tiled ops: without
+        # the lock, both could start a pool and one of them would leak
+        self._pool_lock = threading.Lock()
+
+    # ---------- Helpers ----------
+
+    def _map(self, fn, items):
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self._workers)
+            pool = self._pool
+        return list(pool.map(fn, items))
+
+    def close(self) -> None:
+        """Stops the worker threads."""
+        with self._pool_lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown()
+
+    def _tiles(self, shape) -> List[Tile]:
+        h, w = shape[:2]
+        t = self._tile_size
+        return [(y, min(y + t, h), x, min(x + t, w))
+                for y in range(0, h, t) for x in range(0, w, t)]
+
+    @staticmethod
+    def _with_halo(tile: Tile, halo: int, shape) -> Tuple[Tile, Tile]:
+        """Returns (read window, centre of the window that belongs to the tile)."""
+        y0, y1, x0, x1 = tile
+        h, w = shape[:2]
+        ry0, ry1 = max(0, y0 - halo), min(h, y1 + halo)
+        rx0, rx1 = max(0, x0 - halo), min(w, x1 + halo)
+        return (ry0, ry1, rx0, rx1), (y0 - ry0, y1 - ry0, x0 - rx0, x1 - rx0)
+
+    # ---------- Public API ----------
+
+    def should_tile(self, image) -> bool:
+        """Tiling only pays off when the image spans several tiles."""
+        h, w = image.shape[:2]
+        return h * w > 2 * self._tile_size * self._tile_size
+
+    def supports(self, name: str) -> bool:
+        return name in self.TILED_OPS
+
+    def lut(self, image, table):
+        """Applies a 256-entry lookup table tile by tile."""
+        out = np.empty_like(image)
+
+        def work(tile: Tile) -> None:
+            y0, y1, x0, x1 = tile
+            out[y0:y1, x0:x1] = cv2.LUT(image[y0:y1, x0:x1], table)
+
+        self._map(work, self._tiles(image.shape))
+        return out
+
+    def run(self, image, name: str, params: Tuple = ()):
+        """Runs one supported op tile by tile (same pixels as the whole-image kernel)."""
+        if name in operations.POINTWISE_OPS:
+            return self.lut(image, pointwise.compose([operations.POINTWISE_OPS[name](*params)]))
+        if name == "edges":
+            return self._edges(image, *params)
+        if name not in ("grayscale", "blur"):
+            raise ValueError(f"Operation cannot be tiled: {name}")
+
+        halo = 0
+        if name == "blur":
+            halo = blur_engine.halo(blur_engine.kernel_size(params[0]))
+            if halo is None:
+                # Pyramid blur: already cheap, and not tile-local
+                return operations.blur(image, *params)
+        kernel = operations.KERNELS[name]
+        out = np.empty(operations.output_shape(name, params, image.shape), dtype=image.dtype)
+
+        def work(tile: Tile) -> None:
+            (ry0, ry1, rx0, rx1), (cy0, cy1, cx0, cx1) = self._with_halo(tile, halo, image.shape)
+            result = kernel(image[ry0:ry1, rx0:rx1], *params)
+            y0, y1, x0, x1 = tile
+            out[y0:y1, x0:x1] = result[cy0:cy1, cx0:cx1]
+
+        self._map(work, self._tiles(image.shape))
+        return out
+
+    # ---------- Tiled Canny ----------
+
+    def _suppressed(self, image):
+        """Suppressed gradient magnitude of the whole image, tile by tile."""
+        out = np.empty(image.shape[:2], dtype=np.uint16)
+
+        def work(tile: Tile) -> None:
+            (ry0, ry1, rx0, rx1), (cy0, cy1, cx0, cx1) = self._with_halo(tile, canny.HALO, image.shape)
+            gray = canny.to_gray(image[ry0:ry1, rx0:rx1])
+            y0, y1, x0, x1 = tile
+            out[y0:y1, x0:x1] = canny.suppressed_magnitude(gray)[cy0:cy1, cx0:cx1]
+
+        self._map(work, self._tiles(image.shape))
+        return out
+
+    def _edges(self, image, t1=50, t2=150):
+        low, high = canny.thresholds(t1, t2)
+        tiles = self._tiles(image.shape)
+        h, w = image.shape[:2]
+
+        # Pass 1: gradients + non-max suppression (cached per image, they do
+        # not depend on the thresholds), then the class map (0/1/2) per tile.
+        suppressed = canny.CACHE.get(image, "suppressed", lambda: self._suppressed(image))
+        classes = np.empty((h, w), dtype=np.uint8)
+
+        def classify(tile: Tile) -> None:
+            y0, y1, x0, x1 = tile
+            classes[y0:y1, x0:x1] = canny.classify(suppressed[y0:y1, x0:x1], low, high)
+
+        self._map(classify, tiles)
+
+        # Pass 2: label connected candidates inside each tile.
+        def label(tile: Tile):
+            y0, y1, x0, x1 = tile
+            cls = classes[y0:y1, x0:x1]
+            count, labels = cv2.connectedComponents((cls > 0).astype(np.uint8), connectivity=8)
+            strong = np.zeros(count, dtype=bool)
+            strong[labels[cls == 2]] = True
+            seams = (labels[0].copy(), labels[-1].copy(), labels[:, 0].copy(), labels[:, -1].copy())
+            return count, strong, seams
+
+        labelled = self._map(label, tiles)
+
+        # Give every tile's labels a global id range (0 stays "background").
+        offsets = np.cumsum([0] + [count for count, _, _ in labelled])
+        strong = np.concatenate([s for _, s, _ in labelled])
+        parent = np.arange(offsets[-1], dtype=np.int64)
+
+        def global_ids(i: int, local):
+            return np.where(local > 0, local + offsets[i], 0)
+
+        # Full-length label lines on both sides of every tile seam.
+        t = self._tile_size
+        pairs_a, pairs_b = [], []
+        rows = {}
+        cols = {}
+        for i, (y0, y1, x0, x1) in enumerate(tiles):
+            top, bottom, left, right = labelled[i][2]
+            if y0 > 0:
+                rows.setdefault(y0, np.zeros(w, np.int64))[x0:x1] = global_ids(i, top)
+            if y1 < h:
+                rows.setdefault(y1 - 1, np.zeros(w, np.int64))[x0:x1] = global_ids(i, bottom)
+            if x0 > 0:
+                cols.setdefault(x0, np.zeros(h, np.int64))[y0:y1] = global_ids(i, left)
+            if x1 < w:
+                cols.setdefault(x1 - 1, np.zeros(h, np.int64))[y0:y1] = global_ids(i, right)
+
+        # 8-connectivity across a seam: a pixel touches 3 pixels on the other side.
+        for lines in (rows, cols):
+            for pos in range(t, max(h, w), t):
+                if pos not in lines or pos - 1 not in lines:
+                    continue
+                a, b = lines[pos - 1], lines[pos]
+                for shift in (-1, 0, 1):
+                    aa = a[max(0, -shift):len(a) - max(0, shift)]
+                    bb = b[max(0, shift):len(b) - max(0, -shift)]
+                    both = (aa > 0) & (bb > 0)
+                    pairs_a.append(aa[both])
+                    pairs_b.append(bb[both])
+
+        # Union-find by repeated min-label propagation + pointer jumping.
+        if pairs_a:
+            a = np.concatenate(pairs_a)
+            b = np.concatenate(pairs_b)
+            while True:
+                low_root = np.minimum(parent[a], parent[b])
+                before = parent.copy()
+                np.minimum.at(parent, a, low_root)
+                np.minimum.at(parent, b, low_root)
+                parent = parent[parent]
+                if np.array_equal(parent, before):
+                    break
+
+        root_strong = np.zeros(len(parent), dtype=bool)
+        np.logical_or.at(root_strong, parent, strong)
+        root_strong[0] = False
+        keep = root_strong[parent]
+
+        # Pass 3: relabel each tile (deterministic) and keep strong-connected pixels.
+        out = np.zeros((h, w), dtype=np.uint8)
+
+        def finish(item) -> None:
+            i, (y0, y1, x0, x1) = item
+            cls = classes[y0:y1, x0:x1]
+            _, labels = cv2.connectedComponents((cls > 0).astype(np.uint8), connectivity=8)
+            out[y0:y1, x0:x1] = np.where(keep[global_ids(i, labels)], 255, 0)
+
+        self._map(finish, list(enumerate(tiles)))
+        return out
@@ -0,0 +1,227 @@
+"""
+Lightweight tracing: where does the time of an edit go?
+
+Every traced stage (filter, fused graph step, history, display resample,
+PhotoImage conversion...) records its wall time and the bytes it allocated.
+The session can be exported as Chrome trace_event JSON
+(open it in chrome://tracing or https://ui.perfetto.dev).
+
+Why this design:
+- tracing is OFF by default and then costs one attribute check per traced
+  call: the decorator calls straight through, nothing is recorded.
+- bytes: by default the size of the arrays a stage returns (its output
+  buffer, practically free to measure). With enable(memory=True) the peak
+  allocation is measured with tracemalloc instead - exact for NumPy and
+  OpenCV outputs, but it slows allocations down.
+
+Usage:
+    from tracing import TRACER, traced
+
+    @traced("history.push")
+    def push(...): ...
+
+    with TRACER.span("redraw", "app"):
+        ...
+
+    TRACER.enable()
+    ...
+    print(TRACER.last_breakdown())
+    TRACER.export("session.json")
+"""
+
+from __future__ import annotations
+
+import functools
+import json
+import os
+import threading
+import time
+import tracemalloc
+from collections import deque
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+
+# Events kept for export (oldest dropped first)
+MAX_EVENTS = 200_000
+
+
+def _result_bytes(result) -> int:
+    """Bytes of the arrays a stage returned (an array, or a tuple with arrays)."""
+    if isinstance(result, np.ndarray):
+        return result.nbytes
+    if isinstance(result, (tuple, list)):
+        return sum(item.nbytes for item in result if isinstance(item, np.ndarray))
+    return 0
+
+
+class _Span:
+    """One running stage (see Tracer.span)."""
+
+    __slots__ = ("tracer", "name", "cat", "start", "base", "peak", "children", "nbytes")
+
+    def __init__(self, tracer: "Tracer", name: str, cat: str) -> None:
+        self.tracer = tracer
+        self.name = name
+        self.cat = cat
+        self.children: Dict[str, float] = {}  # child name -> total ms
+        self.nbytes = 0
+        self.start = self.base = self.peak = 0
+
+    def __enter__(self) -> "_Span":
+        self.tracer._begin(self)
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.tracer._end(self)
+
+
+class _NullSpan:
+    """Returned while tracing is off: does nothing."""
+
+    nbytes = 0
+
+    def __enter__(self) -> "_NullSpan":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Tracer:
+    """Collects spans from all threads while enabled."""
+
+    def __init__(self) -> None:
+        self.enabled = False
+        self.memory = False
+        self._origin = time.perf_counter()
+        self._events: deque = deque(maxlen=MAX_EVENTS)
+        self._local = threading.local()
+        self._last: Optional[_Span] = None
+        self._last_ms = 0.0
+
+    # ---------- Switching ----------
+
+    def enable(self, memory: bool = False) -> None:
+        """Start recording; memory=True measures allocations with tracemalloc."""
+        self.memory = memory
+        if memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        self.enabled = True
+
+    def disable(self) -> None:
+        self.enabled = False
+        if self.memory and tracemalloc.is_tracing():
+            tracemalloc.stop()
+        self.memory = False
+
+    def clear(self) -> None:
+        self._events.clear()
+        self._last = None
+
+    # ---------- Recording ----------
+
+    def span(self, name: str, cat: str = ""):
+        """Context manager timing one stage (a no-op while disabled)."""
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name, cat)
+
+    def _stack(self) -> List[_Span]:
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def _begin(self, span: _Span) -> None:
+        stack = self._stack()
+        if self.memory:
+            current, peak = tracemalloc.get_traced_memory()
+            if stack:
+                # The parent must not lose the peak reached so far
+                stack[-1].peak = max(stack[-1].peak, peak)
+            tracemalloc.reset_peak()
+            span.base = span.peak = current
+        stack.append(span)
+        span.start = time.perf_counter()
+
+    def _end(self, span: _Span) -> None:
+        end = time.perf_counter()
+        stack = self._stack()
+        if stack and stack[-1] is span:
+            stack.pop()
+        if self.memory:
+            span.peak = max(span.peak, tracemalloc.get_traced_memory()[1])
+            span.nbytes = max(span.nbytes, span.peak - span.base)
+            if stack:
+                stack[-1].peak = max(stack[-1].peak, span.peak)
+
+        ms = (end - span.start) * 1000
+        if stack:
+            parent = stack[-1].children
+            parent[span.name] = parent.get(span.name, 0.0) + ms
+        elif threading.current_thread() is threading.main_thread():
+            self._last, self._last_ms = span, ms
+
+        self._events.append({
+            "name": span.name, "cat": span.cat or "stage", "ph": "X",
+            "ts": round((span.start - self._origin) * 1e6, 1), "dur": round(ms * 1000, 1),
+            "pid": os.getpid(), "tid": threading.get_ident(),
+            "args": {"bytes": int(span.nbytes)},
+        })
+
+    # ---------- Reading ----------
+
+    def last_breakdown(self, top: int = 4) -> str:
+        """
+        The last finished top-level stage on the main thread and its
+        slowest sub-stages, e.g. "redraw 41.2 ms: render 35.0, photo 4.1".
+        """
+        span = self._last
+        if span is None:
+            return ""
+        text = f"{span.name} {self._last_ms:.1f} ms"
+        parts = sorted(span.children.items(), key=lambda kv: -kv[1])[:top]
+        if parts:
+            text += ": " + ", ".join(f"{name} {ms:.1f}" for name, ms in parts)
+        return text
+
+    def events(self) -> List[dict]:
+        return list(self._events)
+
+    def export(self, path: str) -> int:
+        """Writes the session as Chrome trace_event JSON; returns the number of events."""
+        events = self.events()
+        tids = {e["tid"] for e in events}
+        for thread in threading.enumerate():
+            if thread.ident in tids:
+                events.append({"name": "thread_name", "ph": "M", "pid": os.getpid(),
+                               "tid": thread.ident, "args": {"name": thread.name}})
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+        return len(events)
+
+
+TRACER = Tracer()
+
+
+def traced(name: str, cat: str = "") -> Callable:
+    """
+    Decorator: trace every call of the function as stage `name`.
+    Output bytes are taken from the arrays it returns.
+    """
+    def decorate(fn: Callable) -> Callable:
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not TRACER.enabled:
+                return fn(*args, **kwargs)
+            with TRACER.span(name, cat) as span:
+                result = fn(*args, **kwargs)
+                span.nbytes = _result_bytes(result)
+            return result
+        return wrapper
+    return decorate
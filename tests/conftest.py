@@ -0,0 +1,28 @@
+"""
+Shared test setup: the modules live flat in source/ (run as scripts from
+there), so that directory goes on sys.path.
+"""
+
+import os
+import sys
+
+import cv2
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "source"))
+
+
+def photo_like(height, width, seed=0):
+    """Smooth random shapes plus a little noise: gradients, edges and texture."""
+    rng = np.random.default_rng(seed)
+    coarse = rng.integers(0, 256, (height // 12 + 2, width // 12 + 2, 3), dtype=np.uint8)
+    image = cv2.resize(coarse, (width, height), interpolation=cv2.INTER_LINEAR)
+    noise = rng.integers(-12, 13, image.shape)
+    return np.clip(image.astype(np.int16) + noise, 0, 255).astype(np.uint8)
+
+
+@pytest.fixture
+def image():
+    # Odd size: no tile size divides it, so the last row/column of tiles is partial
+    return photo_like(333, 517)
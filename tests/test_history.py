@@ -0,0 +1,137 @@
+"""
+Undo/redo through the command log (keyframes, replay, spill to disk,
+dropping old steps) must give back exactly the states the edits produced.
+Every state is checked against the same edits applied eagerly with
+operations.run().
+"""
+
+import random
+
+import numpy as np
+import pytest
+
+import operations
+from history_manager import HistoryManager
+from op_graph import LazyImage, replay
+
+from conftest import photo_like
+
+
+# Exact ops only (a chain of resizes is fused, so it is not pixel-identical
+# to resizing step by step). Invertible ones take the inverse-op undo path.
+EDITS = [
+    ("rotate", (90,)),
+    ("rotate", (180,)),
+    ("rotate", (270,)),
+    ("flip", ("h",)),
+    ("flip", ("v",)),
+    ("invert", ()),
+    ("brightness", (30,)),
+    ("brightness", (-45,)),
+    ("contrast", (1.4,)),
+    ("gamma", (0.8,)),
+    ("blur", (5,)),
+    ("blur", (21,)),
+    ("grayscale", ()),
+    ("edges", (40, 120)),
+]
+
+
+def random_edit(rng, shape):
+    if rng.random() < 0.25:
+        h, w = shape[:2]
+        x, y = rng.randrange(w), rng.randrange(h)
+        op, params = rng.choice([("blur", (9,)), ("invert", ()), ("brightness", (25,)),
+                                 ("grayscale", ()), ("edges", (30, 90))])
+        return "region", (x, y, rng.randrange(1, w - x + 1), rng.randrange(1, h - y + 1), op, params)
+    return rng.choice(EDITS)
+
+
+class Model:
+    """What undo/redo should return: eagerly computed states."""
+
+    def __init__(self, image):
+        self.undo = [image]
+        self.redo = []
+
+    def push(self, name, params):
+        self.undo.append(operations.run(self.undo[-1], name, params))
+        self.redo.clear()
+
+    def sync(self, history):
+        # Steps the history dropped to fit its budgets are the oldest ones
+        undo_count, redo_count = history.get_history_size()
+        del self.undo[:len(self.undo) - undo_count]
+        del self.redo[:len(self.redo) - redo_count]
+
+
+def check(state, expected, step):
+    pixels = state.evaluate() if isinstance(state, LazyImage) else state
+    assert pixels.shape == expected.shape, step
+    assert np.array_equal(pixels, expected), step
+
+
+def run_session(history, seed, steps=120):
+    rng = random.Random(seed)
+    image = photo_like(90, 130, seed)
+    model = Model(image)
+    spilled = 0
+    history.push(LazyImage(image))
+    current = LazyImage(image)
+
+    for step in range(steps):
+        action = rng.random()
+        if action < 0.55:
+            name, params = random_edit(rng, model.undo[-1].shape)
+            model.push(name, params)
+            current = replay(current, name, params)
+            current.evaluate()  # shown on screen: pixels cached, can spill
+            if rng.random() < 0.5:
+                history.push_command(name, params, result=current)
+            else:
+                history.push_command(name, params)  # history replays it itself
+        elif action < 0.8:
+            state = history.undo()
+            if state is None:
+                continue
+            model.redo.append(model.undo.pop())
+            current = state
+        else:
+            state = history.redo()
+            if state is None:
+                continue
+            model.undo.append(model.redo.pop())
+            current = state
+        model.sync(history)
+        spilled = max(spilled, history.get_disk_usage()[0])
+        check(current, model.undo[-1], f"seed {seed}, step {step}")
+
+    # Walk the whole history down and back up again
+    while history.can_undo():
+        model.redo.append(model.undo.pop())
+        check(history.undo(), model.undo[-1], f"seed {seed}, final undo")
+    while history.can_redo():
+        model.undo.append(model.redo.pop())
+        check(history.redo(), model.undo[-1], f"seed {seed}, final redo")
+    return spilled
+
+
+@pytest.mark.parametrize("seed", range(6))
+def test_replay_with_keyframes(seed):
+    run_session(HistoryManager(replay=replay, keyframe_interval=3), seed)
+
+
+@pytest.mark.parametrize("seed", range(6))
+def test_replay_with_spill(seed, tmp_path):
+    # About one frame fits in RAM; older keyframes spill to disk, nothing is dropped
+    history = HistoryManager(max_bytes=90 * 130 * 3, replay=replay, keyframe_interval=2,
+                             spill_dir=str(tmp_path))
+    assert run_session(history, seed) > 0
+    history.reset()
+
+
+@pytest.mark.parametrize("seed", range(6))
+def test_replay_when_old_steps_are_dropped(seed):
+    # No disk tier and a tight step limit: the oldest steps are rebased
+    run_session(HistoryManager(replay=replay, keyframe_interval=5, max_history=7,
+                               max_disk_bytes=0), seed)
@@ -0,0 +1,79 @@
+"""Tiled execution must give exactly the pixels of the whole-image kernels."""
+
+import numpy as np
+import pytest
+
+import canny
+import operations
+from tiling import TiledExecutor
+
+
+TILE_SIZES = (64, 100, 128, 257)
+
+# blur 3-31 use the direct kernel, 41 and 61 the box approximation
+BLUR_INTENSITIES = (3, 9, 31, 41, 61)
+
+POINTWISE = [
+    ("brightness", (40,)),
+    ("contrast", (1.5,)),
+    ("gamma", (0.7,)),
+    ("invert", ()),
+    ("levels", (20, 230, 1.2)),
+]
+
+
+@pytest.fixture(params=TILE_SIZES)
+def tiler(request):
+    executor = TiledExecutor(tile_size=request.param, workers=4)
+    yield executor
+    executor.close()
+
+
+@pytest.fixture(autouse=True)
+def fresh_canny_cache():
+    # The tiled and whole-image paths cache different Canny stages per image
+    canny.CACHE.clear()
+    yield
+    canny.CACHE.clear()
+
+
+def assert_same(tiler, image, name, params):
+    expected = operations.run(image, name, params)
+    actual = tiler.run(image, name, params)
+    assert actual.shape == expected.shape
+    assert actual.dtype == expected.dtype
+    differing = int(np.count_nonzero(actual != expected))
+    assert differing == 0, f"{name}{params}: {differing} pixels differ"
+
+
+def test_images_span_several_tiles(tiler, image):
+    assert tiler.should_tile(image)
+
+
+def test_grayscale(tiler, image):
+    assert_same(tiler, image, "grayscale", ())
+
+
+@pytest.mark.parametrize("intensity", BLUR_INTENSITIES)
+def test_blur(tiler, image, intensity):
+    assert_same(tiler, image, "blur", (intensity,))
+
+
+@pytest.mark.parametrize("name,params", POINTWISE)
+def test_lut(tiler, image, name, params):
+    assert_same(tiler, image, name, params)
+
+
+@pytest.mark.parametrize("thresholds", [(50, 150), (10, 40), (100, 250)])
+def test_edges(tiler, image, thresholds):
+    assert_same(tiler, image, "edges", thresholds)
+
+
+def test_edges_on_grayscale(tiler, image):
+    assert_same(tiler, operations.run(image, "grayscale", ()), "edges", (30, 90))
+
+
+def test_edges_threshold_change_reuses_stages(tiler, image):
+    # Second run hits the cached suppressed magnitude: still exact
+    assert_same(tiler, image, "edges", (50, 150))
+    assert_same(tiler, image, "edges", (20, 60))